@@ -0,0 +1,171 @@
+import atexit
+import json
+import numpy as np
+import pygame
+import sys
+
+from math import pi
+from time import perf_counter
+
+from . import client as game_client
+from .include import display
+from .raycast import cast_columns, load_skip_field
+
+# a benchmark run neither saves the settings nor prints anything besides the results
+atexit.unregister(game_client.quit)
+
+FOVS = (60, 90, 120)
+
+
+def camera_path(
+    grid: np.ndarray, tile_size: int, frames: int
+) -> list[tuple[float, float, float]]:
+    """
+    Scripts a camera path that turns on the spot at three open tiles across the map.
+    :param grid: the wall grid of the map
+    :param tile_size: the size of a tile in pixels
+    :param frames: the number of frames of the whole path
+    :return: the x and y in pixels and the angle in radians of every frame
+    """
+    open_tiles = np.argwhere(grid == 0)
+    stops = open_tiles[[0, len(open_tiles) // 2, len(open_tiles) - 1]]
+    per_stop = max(frames // len(stops), 1)
+    path = []
+    for y, x in stops.tolist():
+        for frame in range(per_stop):
+            path.append(
+                (
+                    (x + 0.5) * tile_size,
+                    (y + 0.5) * tile_size,
+                    frame / per_stop * 2 * pi,
+                )
+            )
+    return path
+
+
+def open_arena(size: int = 256, spacing: int = 16) -> np.ndarray:
+    """
+    Builds a big outdoor map: a walled square with a pillar every few tiles.
+    :param size: the width and height of the map in tiles
+    :param spacing: the distance between the pillars in tiles
+    :return: the wall grid
+    """
+    grid = np.zeros((size, size), dtype=np.uint8)
+    grid[[0, -1], :] = grid[:, [0, -1]] = 1
+    grid[spacing::spacing, spacing::spacing] = 1
+    return grid
+
+
+def skip_benchmark(frames: int = 30) -> dict:
+    """
+    Compares casting with and without skipping empty space on a big outdoor map.
+    :param frames: the number of frames to cast
+    :return: the average time per frame in milliseconds of both and the speedup
+    """
+    grid = open_arena()
+    skip = load_skip_field(grid)
+    path = camera_path(grid, 1, frames)
+    times = {}
+    for name, field in (("dda_ms", None), ("skip_ms", skip)):
+        start = perf_counter()
+        for x, y, angle in path:
+            cast_columns(grid, x, y, angle, game_client.game.projection, skip=field)
+        times[name] = (perf_counter() - start) / len(path) * 1000
+    times["speedup"] = times["dda_ms"] / times["skip_ms"]
+    return times
+
+
+def run(frames: int = 120) -> dict:
+    """
+    Renders every map at every resolution and a few fovs with both backends and measures
+    the casting and rendering.
+    :param frames: the number of frames per backend, map, resolution and fov
+    :return: the results, ready to be dumped as JSON
+    """
+    game = game_client.game
+    saved = (game.current_map_name, game.fov, game.resolution, game_client.framebuffer)
+    # the software backend only composites the 3D view, so it wins on costly draws
+    backends = {
+        "hardware": None,
+        "software": game_client.framebuffer or game_client.Framebuffer(),
+    }
+    # the benchmark drives the player directly instead of going through the menus
+    player = game_client.player = game_client.Player()
+    results = []
+    try:
+        for backend, framebuffer in backends.items():
+            game_client.framebuffer = framebuffer
+            for name in sorted(game.maps):
+                game.set_map(name)
+                path = camera_path(game.chunks.walls, game.tile_size, frames)
+                for resolution in range(1, len(game.resolutions_list) + 1):
+                    game.set_res(resolution - game.resolution)
+                    for fov in FOVS:
+                        game.set_fov(fov - game.fov)
+                        cast = render = draw_calls = 0
+                        for x, y, angle in path:
+                            player.rect.center = (x, y)
+                            player.angle = angle
+                            player.start_x = x / game.tile_size
+                            player.start_y = y / game.tile_size
+                            player.enemies_to_render = []
+                            display.renderer.clear()
+
+                            start = perf_counter()
+                            player.cast_rays()
+                            cast += perf_counter() - start
+
+                            # presenting flushes the queued draws, so that's render
+                            # time as well
+                            start = perf_counter()
+                            player.render_map()
+                            display.renderer.present()
+                            render += perf_counter() - start
+                            draw_calls += game.draw_calls
+
+                        count = len(path)
+                        results.append(
+                            {
+                                "backend": backend,
+                                "map": name,
+                                "resolution": resolution,
+                                "ray_density": game.ray_density,
+                                "fov": fov,
+                                "frames": count,
+                                "rays_per_second": len(game.projection) * count / cast,
+                                "cast_ms": cast / count * 1000,
+                                "render_ms": render / count * 1000,
+                                "frame_ms": (cast + render) / count * 1000,
+                                "draw_calls": draw_calls / count,
+                            }
+                        )
+    finally:
+        name, fov, resolution, game_client.framebuffer = saved
+        game.set_map(name)
+        game.set_fov(fov - game.fov)
+        game.set_res(resolution - game.resolution)
+    return {
+        "pygame": pygame.version.ver,
+        "sdl": ".".join(map(str, pygame.get_sdl_version())),
+        "video_driver": pygame.display.get_driver(),
+        "width": display.width,
+        "height": display.height,
+        "render_scale": game.render_scale,
+        "draw_distance": game.draw_distance,
+        "results": results,
+        "open_arena": skip_benchmark(),
+    }
+
+
+def main() -> None:
+    """
+    Runs the benchmark and writes the results to stdout or to the file after --output.
+    """
+    results = json.dumps(run(), indent=2)
+    if game_client.game.cast_pool is not None:
+        game_client.game.cast_pool.close()
+    if "--output" in sys.argv:
+        with open(sys.argv[sys.argv.index("--output") + 1], "w") as f:
+            f.write(results)
+    else:
+        print(results)
@@ -0,0 +1,337 @@
+import multiprocessing as mp
+import numpy as np
+import os
+
+from multiprocessing import shared_memory
+from multiprocessing.synchronize import Barrier, Semaphore
+from pathlib import Path
+from threading import BrokenBarrierError
+from time import perf_counter
+
+from .raycast import ColumnHits, ProjectionTable, cast_columns
+
+# layout of the shared parameter block
+START_X, START_Y, ANGLE, STOP = range(4)
+TABLE = slice(4, 9)
+SKIP = 9
+MAX_DIST = 10
+PARAMS = 11
+
+
+def cast_worker(
+    index: int,
+    workers: int,
+    grid_name: str,
+    grid_shape: tuple[int, int],
+    grid_dtype: np.dtype,
+    params_name: str,
+    hits_name: str,
+    capacity: int,
+    start: Semaphore,
+    barrier: Barrier,
+) -> None:
+    """
+    Casts a share of the columns whenever the main process releases the start semaphore.
+    :param index: the index of the worker, which decides its share of the columns
+    :param workers: the number of workers
+    :param grid_name: the name of the shared wall grid, followed by its skip field
+    :param grid_shape: the shape of the wall grid
+    :param grid_dtype: the tile type of the wall grid, shared by the skip field
+    :param params_name: the name of the shared parameter block
+    :param hits_name: the name of the shared hits of all columns
+    :param capacity: the maximum number of columns
+    :param start: released once per worker by the main process for every frame
+    :param barrier: the barrier shared with the main process, waited on after a frame
+    """
+    grid_shm = shared_memory.SharedMemory(name=grid_name)
+    params_shm = shared_memory.SharedMemory(name=params_name)
+    hits_shm = shared_memory.SharedMemory(name=hits_name)
+    grid = np.ndarray((2, *grid_shape), dtype=grid_dtype, buffer=grid_shm.buf)
+    walls, skip = grid
+    params = np.ndarray(PARAMS, dtype=np.float64, buffer=params_shm.buf)
+    hits = ColumnHits(capacity, hits_shm.buf)
+    table = None
+    parent = mp.parent_process()
+    try:
+        # tell the main process that this worker is ready
+        barrier.wait()
+        while True:
+            # wait for the next frame, but don't outlive a main process that didn't
+            # stop the pool
+            if not start.acquire(timeout=1):
+                if parent is not None and not parent.is_alive():
+                    break
+                continue
+            if params[STOP]:
+                break
+            fov, ray_density, width, height, projection_dist = params[TABLE].tolist()
+            args = (
+                int(fov),
+                int(ray_density),
+                int(width),
+                int(height),
+                projection_dist,
+            )
+            if table is None or table.args != args:
+                table = ProjectionTable(*args)
+            size = len(table)
+            columns = slice(size * index // workers, size * (index + 1) // workers)
+            cast_columns(
+                walls,
+                params[START_X],
+                params[START_Y],
+                params[ANGLE],
+                table,
+                columns=columns,
+                hits=hits.view(columns),
+                skip=skip if params[SKIP] else None,
+                max_dist=params[MAX_DIST],
+            )
+            # tell the main process that this share is done
+            barrier.wait()
+    except BrokenBarrierError:
+        pass
+    finally:
+        # the views have to go before the blocks can be closed
+        del grid, walls, skip, params, hits
+        grid_shm.close()
+        params_shm.close()
+        hits_shm.close()
+
+
+class CastPool:
+    def __init__(
+        self,
+        capacity: int,
+        workers: int | None = None,
+        timeout: float = 1,
+        startup_timeout: float = 30,
+    ) -> None:
+        self.capacity = capacity
+        self.workers = workers or max((os.cpu_count() or 1) - 1, 1)
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+        # set to False once the pool failed or turned out to be slower, after which
+        # everything is cast in-process (a single core can't split the work)
+        self.available = (os.cpu_count() or 1) > 1
+        self.processes = []
+        self.blocks = []
+        self.grid_shape = None
+        self.grid_dtype = None
+        self.version = None
+        # whether the pool was already compared with in-process casting
+        self.checked = False
+
+    def start(self, walls: np.ndarray) -> None:
+        """
+        Starts the worker processes and the shared memory for a wall grid of the given
+        shape and type.
+        :param walls: the wall grid (see load_grid)
+        """
+        self.close()
+        ctx = mp.get_context("spawn")
+        # the walls and their skip field, whose radii fit in any integer type
+        grid_shm = shared_memory.SharedMemory(create=True, size=2 * walls.nbytes)
+        params_shm = shared_memory.SharedMemory(create=True, size=PARAMS * 8)
+        hits_shm = shared_memory.SharedMemory(
+            create=True, size=ColumnHits.nbytes(self.capacity)
+        )
+        self.blocks = [grid_shm, params_shm, hits_shm]
+        self.grid = np.ndarray(
+            (2, *walls.shape), dtype=walls.dtype, buffer=grid_shm.buf
+        )
+        self.params = np.ndarray(PARAMS, dtype=np.float64, buffer=params_shm.buf)
+        self.params[:] = 0
+        self.hits = ColumnHits(self.capacity, hits_shm.buf)
+        self.start_frame = ctx.Semaphore(0)
+        self.barrier = ctx.Barrier(self.workers + 1)
+        for index in range(self.workers):
+            process = ctx.Process(
+                target=cast_worker,
+                args=(
+                    index,
+                    self.workers,
+                    grid_shm.name,
+                    walls.shape,
+                    walls.dtype,
+                    params_shm.name,
+                    hits_shm.name,
+                    self.capacity,
+                    self.start_frame,
+                    self.barrier,
+                ),
+                daemon=True,
+            )
+            process.start()
+            self.processes.append(process)
+        # the workers have to import numpy first
+        self.barrier.wait(self.startup_timeout)
+        self.grid_shape = walls.shape
+        self.grid_dtype = walls.dtype
+        self.version = None
+
+    def cast(
+        self,
+        walls: np.ndarray,
+        start_x: float,
+        start_y: float,
+        angle: float,
+        table: ProjectionTable,
+        skip: np.ndarray | None = None,
+        max_dist: float = 300,
+        version: int | None = None,
+    ) -> ColumnHits:
+        """
+        Casts the columns like cast_columns, split across the worker processes.
+        :param walls: the wall grid (see load_grid)
+        :param start_x: the starting x position of the rays in tiles
+        :param start_y: the starting y position of the rays in tiles
+        :param angle: the player direction in radians
+        :param table: the projection table holding the direction of every column
+        :param skip: the empty space around every wall tile (see load_skip_field)
+        :param max_dist: the distance in tiles after which rays give up
+        :param version: the version of the walls, which changes whenever they do (see
+        ChunkedMap.version); without one the walls are copied to the workers every time
+        :return: the per-column hits
+        """
+        args = (walls, start_x, start_y, angle, table)
+        if not self.available or len(table) > self.capacity:
+            return cast_columns(*args, max_dist=max_dist, skip=skip)
+        try:
+            if walls.shape != self.grid_shape or walls.dtype != self.grid_dtype:
+                self.start(walls)
+            # the skip field belongs to the walls, so it only changes along with them
+            if version is None or version != self.version:
+                self.grid[0] = walls
+                if skip is not None:
+                    self.grid[1] = skip
+                self.params[SKIP] = skip is not None
+                self.version = version
+            self.params[START_X] = start_x
+            self.params[START_Y] = start_y
+            self.params[ANGLE] = angle
+            self.params[MAX_DIST] = max_dist
+            self.params[TABLE] = table.args
+            self.run()
+            # the shared hits are overwritten by the next cast
+            hits = self.hits.view(slice(0, len(table))).copy()
+            if not self.checked:
+                self.checked = True
+                if not self.faster(*args, max_dist=max_dist, skip=skip):
+                    self.close()
+                    self.available = False
+        except (OSError, BrokenBarrierError):
+            # no shared memory or a worker died, so don't try again
+            self.close()
+            self.available = False
+            return cast_columns(*args, max_dist=max_dist, skip=skip)
+        return hits
+
+    def run(self) -> None:
+        """
+        Casts the columns with the parameters in the shared block.
+        """
+        # start the workers, then wait for all of them to finish
+        for _ in range(self.workers):
+            self.start_frame.release()
+        self.barrier.wait(self.timeout)
+
+    def faster(self, *args, rounds: int = 5, **kwargs) -> bool:
+        """
+        Checks whether the pool casts the current frame faster than casting in-process.
+        :param args: the arguments of cast_columns, which are already in the shared
+        block
+        :param rounds: the number of times to cast with both
+        :param kwargs: the keyword arguments of cast_columns
+        :return: whether the pool is faster
+        """
+        start = perf_counter()
+        for _ in range(rounds):
+            cast_columns(*args, **kwargs)
+        serial = perf_counter() - start
+        start = perf_counter()
+        for _ in range(rounds):
+            self.run()
+        return perf_counter() - start < serial
+
+    def close(self) -> None:
+        """
+        Stops the worker processes and frees the shared memory.
+        """
+        if self.processes:
+            self.params[STOP] = 1
+            for _ in range(self.workers):
+                self.start_frame.release()
+            for process in self.processes:
+                process.join(self.timeout)
+                if process.is_alive():
+                    process.terminate()
+            self.processes = []
+        if self.blocks:
+            del self.grid, self.params, self.hits
+            for block in self.blocks:
+                block.close()
+                block.unlink()
+            self.blocks = []
+        self.grid_shape = None
+
+
+def benchmark(
+    walls: np.ndarray,
+    table: ProjectionTable,
+    frames: int = 100,
+    workers: int | None = None,
+) -> dict[str, float]:
+    """
+    Compares in-process casting with the cast pool while turning on the spot.
+    :param walls: the wall grid (see load_grid)
+    :param table: the projection table holding the direction of every column
+    :param frames: the number of frames to cast
+    :param workers: the number of worker processes
+    :return: the average time per frame in milliseconds of both and the speedup
+    """
+    # start in the middle of the first open tile
+    y, x = np.argwhere(walls == 0)[0]
+    poses = [(x + 0.5, y + 0.5, frame * 0.05) for frame in range(frames)]
+
+    start = perf_counter()
+    for pose in poses:
+        cast_columns(walls, *pose, table)
+    serial = (perf_counter() - start) / frames * 1000
+
+    pool = CastPool(len(table), workers)
+    try:
+        # the first cast starts the pool
+        pool.cast(walls, *poses[0], table)
+        start = perf_counter()
+        for pose in poses:
+            pool.cast(walls, *pose, table)
+        parallel = (perf_counter() - start) / frames * 1000
+    finally:
+        pool.close()
+    return {
+        "workers": pool.workers,
+        "available": pool.available,
+        "serial_ms": serial,
+        "parallel_ms": parallel,
+        "speedup": serial / parallel,
+    }
+
+
+if __name__ == "__main__":
+    # python -m client.castpool: a 4K wide view of the strike map, tiled to a big map
+    grid = np.loadtxt(
+        Path("client", "assets", "maps", "strike-walls.csv"),
+        delimiter=",",
+        dtype=np.uint8,
+    )
+    grid = np.tile(grid, (8, 8))
+    results = benchmark(
+        grid, ProjectionTable(60, 3840, 3840, 2160, 32 / np.tan(np.radians(30)))
+    )
+    print(
+        f"{results['workers']} workers: {results['serial_ms']:.2f} ms in-process, "
+        f"{results['parallel_ms']:.2f} ms in the pool ({results['speedup']:.2f}x)"
+    )
+    if not results["available"]:
+        print("the pool isn't faster here, so it falls back to casting in-process")
@@ -0,0 +1,153 @@
+import numpy as np
+import pygame
+
+from collections import OrderedDict
+from itertools import count
+from pygame._sdl2.video import Texture
+
+from .include import display
+from .raycast import load_skip_field
+
+# the versions are unique across all maps, so that a new map never passes for an old one
+map_versions = count()
+
+
+class ChunkedMap:
+    def __init__(
+        self,
+        walls: np.ndarray,
+        floor: np.ndarray,
+        weapons: np.ndarray,
+        oriens: np.ndarray,
+        skip: np.ndarray | None,
+        tile_size: int,
+        tiles: list[pygame.Surface],
+        chunk_size: int = 32,
+        max_chunks: int = 48,
+    ) -> None:
+        # the layers stay compact arrays, which the casting engine reads directly
+        self.walls = walls
+        self.floor = floor
+        self.weapons = weapons
+        self.oriens = oriens
+        self.skip = skip
+        # the ray cache and the cast pool compare this to notice that the walls changed
+        self.version = next(map_versions)
+        self.height, self.width = walls.shape
+        self.tile_size = tile_size
+        self.tiles = tiles
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        # minimap textures of the chunks, the least recently used one first
+        self.textures: OrderedDict[tuple[int, int], Texture] = OrderedDict()
+
+    @property
+    def chunk_px(self) -> int:
+        return self.chunk_size * self.tile_size
+
+    def is_wall(self, x: int, y: int) -> bool:
+        """
+        Checks whether a tile is a wall, counting the tiles outside of the map as walls.
+        :param x: the tile x
+        :param y: the tile y
+        :return: whether the tile is a wall
+        """
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return True
+        return self.walls[y, x] != 0
+
+    def object_at(self, x: int, y: int) -> str:
+        """
+        Gives the wall weapon on a tile the way the weapons layer stores it.
+        :param x: the tile x
+        :param y: the tile y
+        :return: the weapon id followed by its orientation
+        """
+        return f"{self.weapons[y, x]}{self.oriens[y, x]}"
+
+    def rects_near(self, rect: pygame.Rect) -> list[pygame.Rect]:
+        """
+        Builds the collision rects of the walls around a rect, instead of keeping one
+        for every wall of the map.
+        :param rect: the rect in pixels, which can be a FRect
+        :return: the rects of the walls touching the rect or one tile around it
+        """
+        size = self.tile_size
+        x1, y1 = max(int(rect.left // size) - 1, 0), max(int(rect.top // size) - 1, 0)
+        x2 = min(int(rect.right // size) + 2, self.width)
+        y2 = min(int(rect.bottom // size) + 2, self.height)
+        if x1 >= x2 or y1 >= y2:
+            return []
+        ys, xs = np.nonzero(self.walls[y1:y2, x1:x2])
+        return [
+            pygame.Rect((x1 + x) * size, (y1 + y) * size, size, size)
+            for y, x in zip(ys.tolist(), xs.tolist())
+        ]
+
+    def chunk_texture(self, cx: int, cy: int) -> Texture:
+        """
+        Gives the minimap texture of a chunk, drawing it when it isn't cached.
+        :param cx: the chunk x
+        :param cy: the chunk y
+        :return: the texture
+        """
+        key = (cx, cy)
+        if key in self.textures:
+            self.textures.move_to_end(key)
+            return self.textures[key]
+        size = self.chunk_size
+        tiles = self.walls[cy * size : (cy + 1) * size, cx * size : (cx + 1) * size]
+        surf = pygame.Surface(
+            (tiles.shape[1] * self.tile_size, tiles.shape[0] * self.tile_size),
+            pygame.SRCALPHA,
+        )
+        surf.blits(
+            [
+                (self.tiles[tile != 0], (x * self.tile_size, y * self.tile_size))
+                for y, row in enumerate(tiles.tolist())
+                for x, tile in enumerate(row)
+            ],
+            doreturn=False,
+        )
+        self.textures[key] = Texture.from_surface(display.renderer, surf)
+        # forget the chunks that went unused for the longest
+        while len(self.textures) > self.max_chunks:
+            self.textures.popitem(last=False)
+        return self.textures[key]
+
+    def set_tile(self, x: int, y: int, tile: int) -> None:
+        """
+        Changes a wall tile, so that only the minimap texture of its chunk is redrawn.
+        :param x: the tile x
+        :param y: the tile y
+        :param tile: the new tile id (0 for no wall)
+        """
+        self.walls[y, x] = tile
+        if self.skip is not None:
+            if tile:
+                # a new wall only shrinks the empty squares that reach it
+                radius = int(self.skip.max())
+                y1, y2 = max(y - radius, 0), min(y + radius + 1, self.height)
+                x1, x2 = max(x - radius, 0), min(x + radius + 1, self.width)
+                ys, xs = np.ogrid[y1 - y : y2 - y, x1 - x : x2 - x]
+                area = self.skip[y1:y2, x1:x2]
+                area[...] = np.minimum(
+                    area, np.maximum(np.maximum(abs(ys), abs(xs)) - 1, 0)
+                )
+            else:
+                self.skip = load_skip_field(self.walls)
+        # tells the ray cache and the cast pool to pick up the new walls
+        self.version = next(map_versions)
+        self.textures.pop((x // self.chunk_size, y // self.chunk_size), None)
+
+    def chunks_in(self, rect: pygame.Rect) -> list[tuple[int, int]]:
+        """
+        Gives the chunks that overlap an area of the map.
+        :param rect: the area in pixels
+        :return: the chunk x and y of every chunk of the map that overlaps the area
+        """
+        chunk_px = self.chunk_px
+        cx1, cy1 = max(rect.left // chunk_px, 0), max(rect.top // chunk_px, 0)
+        cx2 = min((rect.right - 1) // chunk_px + 1, -(-self.width // self.chunk_size))
+        cy2 = min((rect.bottom - 1) // chunk_px + 1, -(-self.height // self.chunk_size))
+        return [(cx, cy) for cy in range(cy1, cy2) for cx in range(cx1, cx2)]
@@ -2,8 +2,10 @@ import pygame
 import sys
 import json
 import os
+import numpy as np
 
-from math import sin, cos, tan, atan2, pi, radians, degrees, sqrt, hypot
+from bisect import bisect_right
+from math import sin, cos, tan, atan2, pi, radians, degrees, sqrt, hypot, ceil
 from pathlib import Path
 from pygame._sdl2.video import Texture, Image
 from threading import Thread
@@ -12,6 +14,23 @@ from random import uniform as randf
 from typing import Dict
 
 from .include import *
+from .castpool import CastPool
+from .chunks import ChunkedMap
+from .framebuffer import draw_columns, draw_sprite, span_columns
+from .raycast import (
+    ColumnHits,
+    DepthBuffer,
+    ProjectionTable,
+    RayCache,
+    SpanBuffer,
+    cast_planes,
+    cast_ray,
+    find_spans,
+    fog,
+    load_grid,
+    load_skip_field,
+    shade_texels,
+)
 import atexit
 
 
@@ -21,7 +40,7 @@ def new_enemy() -> None:
     """
     x = rand(0, game.map_width - 1)
     y = rand(0, game.map_height - 1)
-    while game.current_map[y][x] != 0:
+    while game.chunks.is_wall(x, y):
         x = rand(0, game.map_width - 1)
         y = rand(0, game.map_height - 1)
     enemies.append(
@@ -39,6 +58,10 @@ def quit() -> None:
         "sens": game.sens,
         "volume": game.get_volume(),
         "max_fps_index": game.max_fps_index,
+        "render_scale": game.render_scale,
+        "draw_distance": game.draw_distance,
+        "minimap_zoom": game.minimap_zoom,
+        "minimap_rotate": game.minimap_rotate,
     }
     with open(Path("client", "settings.json"), "w") as f:
         json.dump(json_save, f)
@@ -46,6 +69,9 @@ def quit() -> None:
     if game.multiplayer and client_tcp:
         client_tcp.req(f"quit|{player.id}|f4")
 
+    if game.cast_pool is not None:
+        game.cast_pool.close()
+
     game.running = False
     pygame.quit()
     print("Exited successfully")
@@ -79,6 +105,11 @@ class Game:
                     self.resolution = json_load["resolution"]
                     self.max_fps_index = json_load["max_fps_index"]
                     self.volume = json_load["volume"]
+                    # older settings files don't have these yet
+                    self.render_scale = json_load.get("render_scale", 100)
+                    self.draw_distance = json_load.get("draw_distance", 64)
+                    self.minimap_zoom = json_load.get("minimap_zoom", 1)
+                    self.minimap_rotate = json_load.get("minimap_rotate", False)
                     pygame.mixer.music.set_volume(self.volume)
             else:
                 open(Path("client", "settings.json"), "w").close()
@@ -91,11 +122,22 @@ class Game:
             self.resolution = 2
             self.max_fps_index = 1
             self.volume = 1
+            self.render_scale = 100
+            self.draw_distance = 64
+            self.minimap_zoom = 1
+            self.minimap_rotate = False
 
-        self.ray_density = int(display.width * (self.resolution / 4))
         self.resolutions_list = [
             int(display.width * coef) for coef in [0.125, 0.25, 0.5, 1.0]
         ]
+        # resolution 0 lets the ray density follow the frame time (see update_dynamic_res)
+        self.dynamic_res = self.resolution == 0
+        if self.dynamic_res:
+            self.ray_density = self.resolutions_list[2]
+        else:
+            self.ray_density = int(display.width * (self.resolution / 4))
+        self.cast_cost = None
+        self.last_res_change = 0
         # misc.
         self.running = True
         self.multiplayer = None
@@ -107,44 +149,31 @@ class Game:
         self.target_zoom = self.zoom = 0
         self.zoom_speed = 0.4
         self.last_zoom = ticks()
-        self.projection_dist = 32 / tan(radians(self.fov / 2))
+        self.projection = None
+        self.update_projection()
+        # optionally cast the columns in worker processes
+        self.cast_pool = None
+        if "--parallel-cast" in sys.argv:
+            self.cast_pool = CastPool(display.width + 1)
+            self.ray_cache = RayCache(caster=self.cast_pool.cast)
+        else:
+            self.ray_cache = RayCache()
         self.rendered_enemies = 0
-        # map
+        # textured draws of the last rendered view (walls and enemy slices)
+        self.draw_calls = 0
+        # map, whose layers are only loaded once it is played
         self.maps = {}
         for file in os.listdir(Path("client", "assets", "maps")):
             file_name = file.split("-")[0]
+            floor = Path("client", "assets", "maps", f"{file_name}-floor.csv")
             self.maps[file_name] = {
-                "walls": load_map_from_csv(
-                    Path("client", "assets", "maps", f"{file_name}-walls.csv")
-                ),
-                "weapons": load_map_from_csv(
-                    Path("client", "assets", "maps", f"{file_name}-weapons.csv"),
-                    int_=False,
-                ),
+                "walls": Path("client", "assets", "maps", f"{file_name}-walls.csv"),
+                "weapons": Path("client", "assets", "maps", f"{file_name}-weapons.csv"),
+                # not every map has a floor layer
+                "floor": floor if os.path.isfile(floor) else None,
             }
 
-        self.current_map = self.maps["strike"]["walls"]
-        self.current_object_map = self.maps["strike"]["weapons"]
-
         self.tile_size = 16
-        self.map_height = len(self.current_map)
-        self.map_width = len(self.current_map[0])
-        self.rects = [
-            [
-                (
-                    pygame.Rect(
-                        x * self.tile_size,
-                        y * self.tile_size,
-                        self.tile_size,
-                        self.tile_size,
-                    )
-                    if self.current_map[y][x] != 0
-                    else None
-                )
-                for x in range(self.map_width)
-            ]
-            for y in range(self.map_height)
-        ]
 
         # misc.
         self.should_render_map = True
@@ -158,22 +187,48 @@ class Game:
             )
             for file_name in ["floor.png", "floor_wall.png"]
         ]
-        self.map_surf = pygame.Surface(
-            (self.map_width * self.tile_size, self.map_height * self.tile_size),
-            pygame.SRCALPHA,
+        self.set_map("strike")
+        self.fps_list = (30, 60, 120, 144, 240, 1000)
+        # what auto resolution aims for without a frame limit, 60 when SDL can't tell
+        rates = pygame.display.get_desktop_refresh_rates()
+        self.refresh_rate = max(rates, default=0) or 60
+
+    def set_map(self, name: str) -> None:
+        """
+        Loads one of the maps and builds everything derived from it (collisions, minimap, etc.).
+        :param name: the name of the map (the part of the file name before the dash)
+        """
+        self.current_map_name = name
+        # array versions of the layers, the lists are only needed while loading
+        walls = load_grid(load_map_from_csv(self.maps[name]["walls"]))
+        objects = load_map_from_csv(self.maps[name]["weapons"], int_=False)
+        # small indoor maps have no empty space worth skipping
+        skip = load_skip_field(walls)
+        # without a floor layer, the whole map gets the floor texture
+        if self.maps[name]["floor"] is not None:
+            floor = load_grid(load_map_from_csv(self.maps[name]["floor"]))
+        else:
+            floor = np.ones_like(walls)
+        self.chunks = ChunkedMap(
+            walls,
+            floor,
+            np.array(
+                [[int(obj[0]) if len(obj) > 1 else 0 for obj in row] for row in objects],
+                dtype=np.uint8,
+            ),
+            np.array(
+                [[int(obj[1]) if len(obj) > 1 else -1 for obj in row] for row in objects],
+                dtype=np.int8,
+            ),
+            skip if skip.max() > 1 else None,
+            self.tile_size,
+            self.tiles,
+            # enough minimap chunks to cover the screen, and a ring around it
+            max_chunks=(ceil(display.width / (32 * self.tile_size)) + 2)
+            * (ceil(display.height / (32 * self.tile_size)) + 2),
         )
-        for y, row in enumerate(self.current_map):
-            for x, tile in enumerate(row):
-                img = self.tiles[tile]
-                self.map_surf.blit(img, (x * self.tile_size, y * self.tile_size))
-        self.map_tex = Texture.from_surface(display.renderer, self.map_surf)
+        self.map_height, self.map_width = walls.shape
         self.mo = self.tile_size * 0
-        self.map_rect = self.map_tex.get_rect(topleft=(self.mo, self.mo))
-        self.fps_list = (30, 60, 120, 144, 240, 1000)
-
-    @property
-    def rect_list(self) -> None:
-        return sum(self.rects, [])
 
     def stop_running(self) -> None:
         self.running = False
@@ -192,10 +247,6 @@ class Game:
             hud = HUD()
             leaderboard = Leaderboard()
 
-            hud.update_health()
-            hud.update_score()
-            hud.update_weapon_general()
-
         if (
             target_state == States.MAIN_MENU and self.state not in [States.MAIN_SETTINGS, States.CONTROLS] 
         ) or (target_state == States.MAIN_SETTINGS and self.state != States.MAIN_MENU):
@@ -214,7 +265,7 @@ class Game:
             and self.state == States.MAIN_MENU
         ):
             # All launch & init requirements
-            leaderboard.texs[player.id] = (text2tex(username_input.text, 32), None)
+            leaderboard.add(player.id, username_input.text)
             msg = json.dumps(
                 {
                     "health": player.health,
@@ -235,6 +286,24 @@ class Game:
 
         global current_buttons
         current_buttons = all_buttons[self.state]
+        # the buttons only check the mouse when it moves, so check it once now
+        for button in current_buttons:
+            button.hover(pygame.mouse.get_pos())
+
+    def update_projection(self) -> None:
+        """
+        Rebuilds the per-column projection table if the fov or the resolution changed.
+        """
+        self.projection_dist = 32 / tan(radians(self.fov / 2))
+        key = (self.fov, self.ray_density, display.width)
+        if self.projection is None or self.projection.key != key:
+            self.projection = ProjectionTable(
+                self.fov,
+                self.ray_density,
+                display.width,
+                display.height,
+                self.projection_dist,
+            )
 
     def get_fov(self) -> int:
         return self.fov
@@ -243,6 +312,7 @@ class Game:
         self.fov += amount
         self.fov = min(self.fov, 120)
         self.fov = max(self.fov, 30)
+        self.update_projection()
 
     def get_sens(self) -> int:
         return self.sens
@@ -251,15 +321,75 @@ class Game:
         self.sens += amount
         self.sens = max(self.sens, 10)
 
-    def get_res(self) -> int:
-        return self.resolution
+    def get_res(self) -> int | str:
+        return self.resolution if not self.dynamic_res else "Auto"
 
     def set_res(self, amount: int) -> None:
         self.resolution += amount
         self.resolution = min(self.resolution, 4)
-        self.resolution = max(self.resolution, 1)
+        self.resolution = max(self.resolution, 0)
+
+        self.dynamic_res = self.resolution == 0
+        self.cast_cost = None
+        if not self.dynamic_res:
+            self.ray_density = self.resolutions_list[self.resolution - 1]
+            self.update_projection()
+
+    def get_draw_distance(self) -> str:
+        return f"{self.draw_distance} tiles"
 
-        self.ray_density = self.resolutions_list[self.resolution - 1]
+    def set_draw_distance(self, amount: int) -> None:
+        self.draw_distance += amount
+        self.draw_distance = min(self.draw_distance, 256)
+        self.draw_distance = max(self.draw_distance, 16)
+
+    def get_render_scale(self) -> str:
+        return f"{self.render_scale}%"
+
+    def set_render_scale(self, amount: int) -> None:
+        self.render_scale += amount
+        self.render_scale = min(self.render_scale, 100)
+        self.render_scale = max(self.render_scale, 25)
+
+    def update_dynamic_res(self, cost: float) -> None:
+        """
+        Adjusts the ray density so that casting and rendering the walls stays within the frame budget.
+        :param cost: the time it took to cast and render the walls this frame in milliseconds
+        """
+        if not self.dynamic_res:
+            return
+        # smooth out single slow frames
+        if self.cast_cost is None:
+            self.cast_cost = cost
+        else:
+            self.cast_cost += (cost - self.cast_cost) * 0.1
+        # unlimited frames would leave no budget at all, so aim for the screen instead
+        max_fps = self.get_max_fps()
+        if max_fps == self.fps_list[-1]:
+            max_fps = self.refresh_rate
+        # the walls may take half of the frame, the rest goes to the hud, the enemies etc.
+        budget = 1000 / max_fps * 0.5
+        # only adjust a few times a second so that the average catches up in between
+        if ticks() - self.last_res_change < 250:
+            return
+        # shrink quickly, but only grow when well below the budget, so that the density doesn't oscillate
+        if self.cast_cost > budget:
+            density = self.ray_density * max(budget / self.cast_cost, 0.75)
+        elif self.cast_cost < budget * 0.6:
+            density = self.ray_density * 1.1
+        else:
+            return
+        # steps of 16 rays, between the lowest resolution and one ray per pixel
+        step = 16
+        density = int(
+            min(max(round(density / step) * step, self.resolutions_list[0]), display.width)
+        )
+        if density != self.ray_density:
+            self.ray_density = density
+            self.update_projection()
+            # the average was measured at the old density
+            self.cast_cost = None
+        self.last_res_change = ticks()
 
     def set_volume(self, amount: int) -> None:
         # 0.05 is for rounding to steps of 5
@@ -293,32 +423,63 @@ class GlobalTextures:
         self.id = None
         self.color = Colors.WHITE
         self.angle = radians(-90)
-        self.arrow_img = Image(
-            imgload(
-                "client", "assets", "images", "minimap", "player_arrow.png", scale=1
-            )
+        # the players share the arrow, each with an image of their own for the color
+        self.arrow_img = imgload(
+            "client", "assets", "images", "minimap", "player_arrow.png", packed=True
         )
         self.arrow_rect = pygame.Rect(0, 0, 16, 16)
         self.rect = pygame.FRect((self.x, self.y, self.w, self.h))
+        self.heart_tex = imgload(
+            "client", "assets", "images", "hud", "heart.png", packed=True
+        )
+        # the walls and wall weapons are drawn from a texture per mip level, each with all
+        # of the shade buckets stacked vertically (see shade_atlas), 32 steps above black
+        self.shade_buckets = 33
+        self.mip_levels = 4
         self.wall_textures = [
             (
-                Texture.from_surface(
-                    display.renderer,
+                shade_atlas(
                     pygame.transform.scale_by(
                         pygame.image.load(
                             Path("client", "assets", "images", "3d", file_name + ".png")
                         ),
                         0.25,
                     ),
+                    self.shade_buckets,
+                    self.mip_levels,
                 )
                 if file_name is not None
                 else None
             )
             for file_name in [None, "wall", "floor"]
         ]
+        self.wall_texture_widths = np.array(
+            [tex[0].width if tex is not None else 1 for tex in self.wall_textures]
+        )
+        # shaded texels of the floor layer tiles (see shade_texels), where tile 0 is outside of the map
+        floor = pygame.surfarray.array3d(
+            pygame.transform.scale_by(
+                pygame.image.load(Path("client", "assets", "images", "3d", "floor.png")),
+                0.25,
+            )
+        ).transpose(1, 0, 2)
+        self.floor_texels = shade_texels(
+            np.stack((np.full_like(floor, Colors.BROWN), floor))
+        )
+        # the ceiling reuses the floor texture, darkened to the old ceiling color
+        ceiling = np.minimum(floor * (Colors.DARK_GRAY[0] / floor.mean()), 255)
+        self.ceiling_texels = shade_texels(
+            np.stack((np.full_like(floor, Colors.DARK_GRAY[:3]), ceiling.astype(np.uint8)))
+        )
         self.object_textures = [
             (
-                imgload("client", "assets", "images", "objects", file_name + ".png")
+                shade_atlas(
+                    pygame.image.load(
+                        Path("client", "assets", "images", "objects", file_name + ".png")
+                    ),
+                    self.shade_buckets,
+                    self.mip_levels,
+                )
                 if file_name is not None and file_name not in ("Knife", "Pistol")
                 else None
             )
@@ -326,8 +487,7 @@ class GlobalTextures:
         ]
         self.highlighted_object_textures = [
             (
-                Texture.from_surface(
-                    display.renderer,
+                shade_atlas(
                     borderize(
                         pygame.image.load(
                             Path(
@@ -340,17 +500,33 @@ class GlobalTextures:
                         ),
                         Colors.YELLOW,
                     ),
+                    self.shade_buckets,
+                    self.mip_levels,
                 )
                 if file_name is not None and file_name not in ("Knife", "Pistol")
                 else None
             )
             for file_name in weapon_names
         ]
+        self.object_texture_widths = np.array(
+            [tex[0].width if tex is not None else 1 for tex in self.object_textures]
+        )
+        self.highlighted_object_texture_widths = np.array(
+            [
+                tex[0].width if tex is not None else 1
+                for tex in self.highlighted_object_textures
+            ]
+        )
 
         self.mask_object_textures = [
             (
                 imgload(
-                    "client", "assets", "images", "mask_objects", file_name + ".png"
+                    "client",
+                    "assets",
+                    "images",
+                    "mask_objects",
+                    file_name + ".png",
+                    packed=True,
                 )
                 if file_name is not None and file_name not in ("Knife",)
                 else None
@@ -369,6 +545,7 @@ class GlobalTextures:
                     scale=6,
                     return_rect=True,
                     colorkey=Colors.PINK,
+                    packed=True,
                 )
                 for i in range(
                     1,
@@ -390,52 +567,32 @@ class HUD:
         self.ammo_tex = None
         self.weapon_name_tex = None
         self.weapon_tex = None
-        self.heart_tex = Texture.from_surface(
-            display.renderer,
-            pygame.image.load(Path("client", "assets", "images", "hud", "heart.png")),
-        )
+        self.heart_tex = gtex.heart_tex
         self.heart_rect = self.heart_tex.get_rect(
             bottomright=(150, display.height - 12)
         )
         self.timer_tex = None
         self.timer_rect = None
+        # the health and score on the left and the weapon parts on the right, each in a
+        # texture just big enough for them, only redrawn when their values change
+        self.parts: dict[str, tuple[Texture, pygame.Rect]] = {}
+        self.key = None
 
     def update(self) -> None:
         """
         The update function of the HUD: it renders the score, ammo, health, etc..
         """
-        if self.health_tex is not None:
-            display.renderer.blit(self.health_tex, self.health_rect)
-        if self.score_tex is not None:
-            display.renderer.blit(self.score_tex, self.score_rect)
-        if self.ammo_tex is not None:
-            display.renderer.blit(self.ammo_tex, self.ammo_rect)
-            w, h = 3, 25
-            mag_size = weapon_data[player.weapon]["mag"]
-            if mag_size <= 16:
-                max_width = 80
-                gap_width = (max_width - w * mag_size) / (mag_size - 1)
-                mult = gap_width + w
-                for xo in range(mag_size):
-                    color = Colors.WHITE if xo < player.mag else Colors.GRAY
-                    fill_rect(
-                        color,
-                        (
-                            self.ammo_rect.x - xo * mult - 15,
-                            self.ammo_rect.centery - h / 2 + 2,
-                            w,
-                            h,
-                        ),
-                    )
-            else:
-                display.renderer.blit(self.mag_tex, self.mag_rect)
-
-        if self.weapon_name_tex is not None:
-            display.renderer.blit(self.weapon_name_tex, self.weapon_name_rect)
-        if self.weapon_tex is not None:
-            display.renderer.blit(self.weapon_tex, self.weapon_rect)
-
+        key = (player.health, player.score, player.weapon, player.mag, player.ammo)
+        if key != self.key:
+            self.key = key
+            self.redraw()
+        for tex, area in self.parts.values():
+            # the texture may be bigger than the part since it was drawn for wider values
+            display.renderer.blit(tex, area, pygame.Rect((0, 0), area.size))
+        # the icons have translucent edges, which only blend right onto the frame itself
+        display.renderer.blit(self.weapon_tex, self.weapon_rect)
         display.renderer.blit(self.heart_tex, self.heart_rect)
+
         for i, message in enumerate(feed):
             if ticks() - 5000 > message[1]:
                 feed.remove(message)
@@ -452,6 +609,82 @@ class HUD:
             timer_tex, timer_rect = write("midleft", timer, v_fonts[70], Colors.WHITE, display.width / 2 - 60, 40)
             display.renderer.blit(timer_tex, timer_rect)
 
+    def redraw(self) -> None:
+        """
+        Redraws the health, score and weapon parts of the HUD into their textures.
+        """
+        self.update_health()
+        self.update_score()
+        self.update_weapon_general()
+
+        weapon = [
+            (self.ammo_tex, self.ammo_rect),
+            (self.weapon_name_tex, self.weapon_name_rect),
+        ]
+        pips = []
+        w, h = 3, 25
+        mag_size = weapon_data[player.weapon]["mag"]
+        if mag_size <= 16:
+            max_width = 80
+            gap_width = (max_width - w * mag_size) / (mag_size - 1)
+            mult = gap_width + w
+            for xo in range(mag_size):
+                color = Colors.WHITE if xo < player.mag else Colors.GRAY
+                pips.append(
+                    (
+                        color,
+                        (
+                            self.ammo_rect.x - xo * mult - 15,
+                            self.ammo_rect.centery - h / 2 + 2,
+                            w,
+                            h,
+                        ),
+                    )
+                )
+        else:
+            weapon.append((self.mag_tex, self.mag_rect))
+
+        target = display.renderer.target
+        self.draw_part(
+            "stats",
+            [(self.health_tex, self.health_rect), (self.score_tex, self.score_rect)],
+            [],
+        )
+        self.draw_part("weapon", weapon, pips)
+        display.renderer.target = target
+
+    def draw_part(
+        self,
+        name: str,
+        texs: list[tuple[Texture, pygame.Rect]],
+        fills: list[tuple[Color, tuple[float, float, float, float]]],
+    ) -> None:
+        """
+        Draws a part of the HUD into its own texture, which is as big as the part.
+        :param name: the name of the part
+        :param texs: the textures and where to put them on the screen
+        :param fills: the colors and the screen rects to fill
+        """
+        # the fills can start in the middle of a pixel, so they reach one pixel further
+        area = texs[0][1].unionall(
+            [rect for _, rect in texs[1:]]
+            + [pygame.Rect(x, y, w + 1, h + 1) for _, (x, y, w, h) in fills]
+        )
+        tex = self.parts[name][0] if name in self.parts else None
+        if tex is None or tex.width < area.width or tex.height < area.height:
+            tex = Texture(display.renderer, area.size, target=True)
+            tex.blend_mode = pygame.BLENDMODE_BLEND
+        self.parts[name] = (tex, area)
+
+        display.renderer.target = tex
+        # transparent white, so that the edges of the white text don't blend to black
+        display.renderer.draw_color = (255, 255, 255, 0)
+        display.renderer.clear()
+        for part_tex, rect in texs:
+            display.renderer.blit(part_tex, rect.move(-area.x, -area.y))
+        for color, (x, y, w, h) in fills:
+            fill_rect(color, (x - area.x, y - area.y, w, h))
+
     def update_weapon_general(self) -> None:
         """
         The textures for general weapon stuff get updated (weapon image, ammo, name). Doing this each frame is expensive.
@@ -471,6 +704,7 @@ class HUD:
             Colors.WHITE,
             16,
             display.height - 4,
+            blit=False,
         )
 
     def update_score(self) -> None:
@@ -484,14 +718,7 @@ class HUD:
             Colors.WHITE,
             16,
             self.health_rect.top,
-        )
-        self.score_tex, self.score_rect = write(
-            "bottomleft",
-            f"${player.score}",
-            v_fonts[48],
-            Colors.WHITE,
-            16,
-            self.health_rect.top,
+            blit=False,
         )
 
     def update_ammo(self) -> None:
@@ -506,6 +733,7 @@ class HUD:
             Colors.WHITE if player.ammo > 0 else Colors.RED,
             self.weapon_rect.left - 16,
             self.weapon_rect.centery,
+            blit=False,
         )
         if max_mag_size > 16:
             self.mag_tex, self.mag_rect = write(
@@ -515,6 +743,7 @@ class HUD:
                 Colors.WHITE,
                 self.ammo_rect.left - 5,
                 self.ammo_rect.bottom,
+                blit=False,
             )
 
     def update_weapon_name(self) -> None:
@@ -528,6 +757,7 @@ class HUD:
             Colors.WHITE,
             display.width - 16,
             self.ammo_rect.y,
+            blit=False,
         )
 
     def update_weapon_tex(self) -> None:
@@ -545,48 +775,112 @@ class HUD:
 
 class Leaderboard:
     def __init__(self) -> None:
-        self.texs: Dict[str, tuple[Texture, Optional[int]]] = {}
+        self.names: Dict[str, str] = {}
+        # score, kills and deaths of every player, as last reported
+        self.stats: Dict[str, tuple[int, int, int]] = {}
+        # the ids of the named players, the best K/D first
+        self.ranking: list[str] = []
+        # one texture for every row, dropped when the row changes
+        self.row_texs: Dict[str, Texture] = {}
+        self.header_tex: Optional[Texture] = None
+
+    def kd(self, id_: str) -> float:
+        """
+        Gives the kill/death ratio which the players are ranked by.
+        :param id_: the id of the player
+        :return: the kills divided by the deaths, or the kills without deaths
+        """
+        _, kills, deaths = self.stats.get(id_, (0, 0, 0))
+        return kills / deaths if deaths > 0 else kills
+
+    def rank(self, id_: str) -> None:
+        """
+        Moves a player to its place in the ranking, after the players with the same K/D.
+        :param id_: the id of the player
+        """
+        if id_ in self.ranking:
+            self.ranking.remove(id_)
+        index = bisect_right(self.ranking, -self.kd(id_), key=lambda x: -self.kd(x))
+        self.ranking.insert(index, id_)
+
+    def add(self, id_: str, name: str) -> None:
+        """
+        Adds a player to the leaderboard.
+        :param id_: the id of the player
+        :param name: the name of the player
+        """
+        self.names[id_] = name
+        self.row_texs.pop(id_, None)
+        self.rank(id_)
+
+    def remove(self, id_: str) -> None:
+        """
+        Removes a player from the leaderboard.
+        :param id_: the id of the player
+        """
+        self.names.pop(id_, None)
+        self.stats.pop(id_, None)
+        self.row_texs.pop(id_, None)
+        if id_ in self.ranking:
+            self.ranking.remove(id_)
+
+    def set_stats(self, id_: str, score: int, kills: int, deaths: int) -> None:
+        """
+        Records the stats of a player, which only redraws and reranks it when they changed.
+        :param id_: the id of the player
+        :param score: the score
+        :param kills: the kills
+        :param deaths: the deaths
+        """
+        if self.stats.get(id_) == (score, kills, deaths):
+            return
+        self.stats[id_] = (score, kills, deaths)
+        self.row_texs.pop(id_, None)
+        if id_ in self.names:
+            self.rank(id_)
+
+    @staticmethod
+    def row_tex(cells: list[str | int]) -> Texture:
+        """
+        Renders the cells of a row, a fifth of the screen apart, into one texture.
+        :param cells: the content of the cells
+        :return: the texture
+        """
+        surfs = [v_fonts[32].render(str(cell), True, Colors.WHITE) for cell in cells]
+        step = int(display.width / 5)
+        surf = pygame.Surface(
+            (
+                step * (len(surfs) - 1) + surfs[-1].get_width(),
+                max(cell.get_height() for cell in surfs),
+            ),
+            pygame.SRCALPHA,
+        )
+        # transparent white, so that the edges of the white text don't blend to black
+        surf.fill((255, 255, 255, 0))
+        for i, cell in enumerate(surfs):
+            surf.blit(cell, (step * i, 0))
+        return Texture.from_surface(display.renderer, surf)
 
     def update(self) -> None:
         """
         The leaderboard which shows the players and their scores.
         """
-        # Sort by K/D
-        scores: Dict[str, float] = {
-            player.id: (
-                player.kills / player.deaths if player.deaths > 0 else player.kills
-            )
-        } | {
-            enemy.id: enemy.kills / enemy.deaths if enemy.deaths > 0 else enemy.kills
-            for enemy in enemies
-        }
-        scores = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-
-        new_texs: Dict[str, tuple[Texture, int]] = {}
-        for score_id, score in scores:
-            for texs_id, (tex, _) in self.texs.items():
-                if texs_id == score_id:
-                    new_texs[texs_id] = (tex, score)
-                    break
-
-        self.texs = new_texs
-
-        # Render header
-        for id, tex in {
-            1: "Name",
-            2: "Score",
-            3: "Kills",
-            4: "Deaths",
-        }.items():
-            tex = text2tex(tex, 32)
-            display.renderer.blit(
-                tex,
-                tex.get_rect(topleft=(display.width * id / 5, display.height / 8 - 32)),
-            )
+        if self.header_tex is None:
+            self.header_tex = self.row_tex(["Name", "Score", "Kills", "Deaths"])
+        display.renderer.blit(
+            self.header_tex,
+            self.header_tex.get_rect(
+                topleft=(display.width * 1 / 5, display.height / 8 - 32)
+            ),
+        )
 
-        # Render data
-        for i, (id, (tex, _)) in enumerate(self.texs.items()):
-            # Name
+        for i, id_ in enumerate(self.ranking):
+            if id_ not in self.row_texs:
+                score, kills, deaths = self.stats.get(id_, (0, 0, 0))
+                self.row_texs[id_] = self.row_tex(
+                    [self.names[id_], score, kills, deaths]
+                )
+            tex = self.row_texs[id_]
             display.renderer.blit(
                 tex,
                 tex.get_rect(
@@ -594,45 +888,6 @@ class Leaderboard:
                 ),
             )
 
-            # Score
-            dict1 = {player.id: player.score} | {
-                enemy.id: enemy.score for enemy in enemies.copy()
-            }
-            array = [score for id_, score in dict1.items() if id_ == id]
-            score_tex = text2tex(array[0], 32)
-            display.renderer.blit(
-                score_tex,
-                score_tex.get_rect(
-                    topleft=(display.width * 2 / 5, (display.height / 8) + (32 * i))
-                ),
-            )
-
-            # Kills
-            dict1 = {player.id: player.kills} | {
-                enemy.id: enemy.kills for enemy in enemies.copy()
-            }
-            array = [kills for id_, kills in dict1.items() if id_ == id]
-            kills_tex = text2tex(array[0], 32)
-            display.renderer.blit(
-                kills_tex,
-                kills_tex.get_rect(
-                    topleft=(display.width * 3 / 5, (display.height / 8) + (32 * i))
-                ),
-            )
-
-            # Deaths
-            dict1 = {player.id: player.deaths} | {
-                enemy.id: enemy.deaths for enemy in enemies.copy()
-            }
-            array = [deaths for id_, deaths in dict1.items() if id_ == id]
-            deaths_tex = text2tex(array[0], 32)
-            display.renderer.blit(
-                deaths_tex,
-                deaths_tex.get_rect(
-                    topleft=(display.width * 4 / 5, (display.height / 8) + (32 * i))
-                ),
-            )
-
 
 class PlayerSelector:
     def __init__(self) -> None:
@@ -805,11 +1060,7 @@ class Player:
         self.deaths = 0
         self.color = Colors.WHITE
         self.angle = radians(-90)
-        self.arrow_img = Image(
-            imgload(
-                "client", "assets", "images", "minimap", "player_arrow.png", scale=1
-            )
-        )
+        self.arrow_img = Image(gtex.arrow_img)
         self.arrow_rect = pygame.Rect(0, 0, 16, 16)
         self.rect = pygame.FRect((self.x, self.y, self.w, self.h))
 
@@ -850,6 +1101,16 @@ class Player:
 
         self.bob = 0
         self.to_equip: tuple[tuple[int, int], int] | None = None
+        # results of the last cast, reused while the pose doesn't change
+        self.cone_hits = None
+        self.cone_points = []
+        # the most rays the minimap view cone is made of, whatever the ray density
+        self.cone_rays = 48
+        self.spans_key = None
+        # walls, then wall weapons, then highlighted wall weapons
+        self.spans = SpanBuffer(2 * (display.width + 1))
+        self.spans_to_equip = None
+        self.depth = DepthBuffer(game.projection, np.full(len(game.projection), np.inf))
         self.audio_channels = [pygame.mixer.find_channel() for _ in range(2)]
 
         if game.multiplayer:
@@ -937,7 +1198,6 @@ class Player:
                     self.mag = self.new_mag
                     self.ammo = self.new_ammo
                     self.weapon_reload_offset = 0
-                    hud.update_weapon_general(self)
 
             if self.switching_weapons:
                 # switch down
@@ -947,7 +1207,6 @@ class Player:
                 ):
                     self.weapon_switch_direc = -self.weapon_switch_direc
                     self.weapon_index = int(not self.weapon_index)  # 0 -> 1, 1 -> 0
-                    hud.update_weapon_general(self)
                 # reload back up and get the ammo and magazine that was promised to you beforehand
                 if self.weapon_switch_direc == -1 and self.weapon_switch_offset <= 0:
                     self.switching_weapons = False
@@ -968,15 +1227,7 @@ class Player:
         The player draw function that also renders the to-be-equipped weapon.
         """
         self.arrow_rect.center = self.rect.center
-        self.arrow_img.angle = degrees(self.angle)
-        display.renderer.blit(
-            self.arrow_img,
-            pygame.Rect(
-                self.arrow_rect.x + game.mo,
-                self.arrow_rect.y + game.mo,
-                *self.arrow_rect.size,
-            ),
-        )
+        minimap.draw_marker(self.arrow_img, *self.arrow_rect.center, self.angle)
         # draw_rect(Colors.GREEN, self.rect)
         if self.to_equip is not None:
             coord, obj = self.to_equip
@@ -1002,40 +1253,76 @@ class Player:
 
     def render_map(self) -> None:
         """
-        Renders the minimap.
+        Renders the 3D view: floor, ceiling, walls, enemies and the damage tint.
         """
-        game.mo = game.tile_size * 0
-        game.map_rect = game.map_tex.get_rect(topleft=(game.mo, game.mo))
         game.rendered_enemies = 0
-        self.walls_to_render.sort(key=lambda x: -x[0])
-        for dist_px, tex, dest, area, color in self.walls_to_render:
-            # # render enemy first
-            if self.enemies_to_render:
-                enemy = self.enemies_to_render[0]
-                if enemy.dist_px > dist_px:
-                    enemy.render()
-                    del self.enemies_to_render[0]
-            # render the texture after the (farther away) enemy
-            tex.color = color
-            display.renderer.blit(tex, dest, area)
-        # render the remaining enemies
+        scene_target.begin()
+        # the spans are queued without the view offset
+        yo = self.view_yoffset
+        if framebuffer is not None:
+            framebuffer.render_walls(self.spans, yo)
+        else:
+            planes.render()
+            self.draw_spans(yo)
+        # render the enemies on top, clipped against the walls in front of them
         for enemy in self.enemies_to_render:
             enemy.render()
+        if framebuffer is not None:
+            framebuffer.present()
+        display.renderer.blit(redden_game.tex, redden_game.rect)
+        scene_target.end()
 
-        display.renderer.blit(game.map_tex, game.map_rect)
-        if game.debug_map:
-            for y in range(game.map_height):
-                draw_line(
-                    Colors.WHITE,
-                    (game.tile_size, (y + 1) * self.tile_size),
-                    ((game.map_width + 1) * game.tile_size, (y + 1) * self.tile_size),
-                )
-            for x in range(game.map_width):
-                draw_line(
-                    Colors.WHITE,
-                    ((x + 1) * game.tile_size, game.tile_size),
-                    ((x + 1) * game.tile_size, (game.map_height + 1) * game.tile_size),
-                )
+    def render_minimap(self) -> None:
+        """
+        Renders the minimap around the player, with the view cone on top.
+        """
+        minimap.follow(self.rect.centerx, self.rect.centery, self.angle)
+        minimap.render()
+        # the view cone as a fan of triangles between neighbouring rays
+        if self.cone:
+            origin = minimap.to_screen(
+                self.start_x * game.tile_size, self.start_y * game.tile_size
+            )
+            points = [minimap.to_screen(x, y) for x, y in self.cone]
+            minimap.begin()
+            display.renderer.draw_color = Colors.GREEN
+            for p1, p2 in zip(points, points[1:]):
+                display.renderer.fill_triangle(origin, p1, p2)
+            minimap.end()
+
+    def draw_spans(self, yo: float) -> None:
+        """
+        Draws the queued wall and wall weapon spans as textured quads.
+        :param yo: the view offset, which the spans are queued without
+        """
+        # walls before objects, then grouped by texture so that consecutive draws
+        # share their texture and SDL can batch them
+        spans = self.spans
+        order = spans.order()
+        game.draw_calls = spans.size
+        lookups = (
+            gtex.wall_textures,
+            gtex.object_textures,
+            gtex.highlighted_object_textures,
+        )
+        # the shading is baked into the textures, so there is no color modulation
+        buckets = gtex.shade_buckets
+        for stage, tex_id, x1, x2, y1, y2, b1, b2, u1, u2, _, _, bucket, lod in zip(
+            *(getattr(spans, name)[order].tolist() for name, _ in spans.fields)
+        ):
+            tex = lookups[stage][tex_id][lod]
+            v1 = bucket / buckets
+            v2 = (bucket + 1) / buckets
+            tex.draw_quad(
+                (x1, y1 + yo),
+                (x2, y2 + yo),
+                (x2, b2 + yo),
+                (x1, b1 + yo),
+                (u1, v1),
+                (u2, v1),
+                (u2, v2),
+                (u1, v2),
+            )
 
     def try_to_buy_wall_weapon(self) -> None:
         """
@@ -1165,15 +1452,15 @@ class Player:
                 self.last_step = ticks()
             # x-col
             self.rect.x += xvel
-            for rect in game.rect_list:
-                if rect is not None and self.rect.colliderect(rect):
+            for rect in game.chunks.rects_near(self.rect):
+                if self.rect.colliderect(rect):
                     if xvel >= 0:
                         self.rect.right = rect.left
                     else:
                         self.rect.left = rect.right
             self.rect.y += yvel
-            for rect in game.rect_list:
-                if rect is not None and self.rect.colliderect(rect):
+            for rect in game.chunks.rects_near(self.rect):
+                if self.rect.colliderect(rect):
                     if yvel >= 0:
                         self.rect.bottom = rect.top
                     else:
@@ -1197,11 +1484,6 @@ class Player:
                 y = tile_y + yo
                 self.surround.append((x, y))
 
-        # cast the rays
-        o = -game.fov // 2
-        for index in range(game.ray_density + 1):
-            self.cast_ray(o, index)
-            o += game.fov / game.ray_density
         self.start_x_px = self.start_x * game.tile_size
         self.start_y_px = self.start_y * game.tile_size
         for enemy in enemies:
@@ -1209,12 +1491,22 @@ class Player:
             dx = enemy.indicator_rect.centerx - self.start_x_px
             enemy.player_pov_angle = degrees(atan2(dy, dx))
             enemy.dist_px = hypot(dy, dx)
+        # the enemies in the fog are culled before any of their hitboxes are worked out
+        draw_distance_px = game.draw_distance * game.tile_size
         self.enemies_to_render = sorted(
-            enemies, key=lambda te: te.dist_px, reverse=True
+            (enemy for enemy in enemies if enemy.dist_px < draw_distance_px),
+            key=lambda te: te.dist_px,
+            reverse=True,
         )
 
+        # the rays, then the floor, the ceiling and the walls
+        cast_start = time.perf_counter()
+        self.cast_rays()
+
         # map ofc
         self.render_map()
+        game.update_dynamic_res((time.perf_counter() - cast_start) * 1000)
+        self.render_minimap()
 
         # processing other important joystick input
         shoot_auto = False
@@ -1281,7 +1573,8 @@ class Player:
                 if enemy.rendering and not enemy.regenerating:
                     if enemy.rect.collidepoint(bullet_pos):
                         # the body in general is hit
-                        if enemy.dist_px <= player.wall_distance:
+                        column = player.depth.column(bullet_pos[0])
+                        if not player.depth.occluded(column, enemy.dist_px):
                             # the enemy is not obstructed by any walls
                             mult = 0
                             if not melee:
@@ -1303,7 +1596,6 @@ class Player:
 
             self.last_shot = ticks()
             self.mag -= 1
-            hud.update_weapon_general()
             if game.multiplayer:
                 client_tcp.req(
                     f"shoot|{self.id}|{self.weapon}|{self.arrow_rect.x}|{self.arrow_rect.y}"
@@ -1371,153 +1663,190 @@ class Player:
                 self.weapon_anim = 0
                 self.last_melee = ticks()
 
-    def cast_ray(
-        self,
-        deg_offset: float,
-        index: int,
-        start_x: Optional[int | float] = None,
-        start_y: Optional[int | float] = None,
-        abs_angle: bool = False,
-    ):
-        """
-        Casts a ray in given direction to render a wall.
-        :param deg_offset: the offset from the player direction
-        :param index: the index of the ray used for calculating the x position of the wall
-        :param start_x: the starting x position of the ray
-        :param start_y: the starting y position of the ray
-        :param abs_ange: whether to pass the ray angle in absolute fashion (instead of the deg_offset)
-        """
-        offset = radians(deg_offset)
-        if not abs_angle:
-            angle = self.angle + offset
-        else:
-            angle = offset
-        dx = cos(angle)
-        dy = sin(angle)
-
-        y_length = x_length = 0
-        start_x = start_x if start_x is not None else self.start_x
-        start_y = start_y if start_y is not None else self.start_y
-        cur_x, cur_y = [int(start_x), int(start_y)]
-        hypot_x, hypot_y = sqrt(1 + (dy / dx) ** 2), sqrt(1 + (dx / dy) ** 2)
-
-        if dx < 0:
-            step_x = -1
-            x_length = (start_x - cur_x) * hypot_x
-        else:
-            step_x = 1
-            x_length = (cur_x + 1 - start_x) * hypot_x
-        if dy < 0:
-            step_y = -1
-            y_length = (start_y - cur_y) * hypot_y
-        else:
-            step_y = 1
-            y_length = (cur_y + 1 - start_y) * hypot_y
-
-        col = False
-        dist = 0
-        max_dist = 300
-        while not col and dist < max_dist:
-            if x_length < y_length:
-                cur_x += step_x
-                dist = x_length
-                x_length += hypot_x
-            else:
-                cur_y += step_y
-                dist = y_length
-                y_length += hypot_y
-            tile_value = game.current_map[cur_y][cur_x]
-            if tile_value != 0:
-                col = True
-        if col:
-            # object (wall weapon)
-            obj = game.current_object_map[cur_y][cur_x]
-            # general ray calculations (big branin)
-            p1 = (start_x * game.tile_size, start_y * game.tile_size)
-            p2 = (
-                p1[0] + dist * dx * game.tile_size,
-                p1[1] + dist * dy * game.tile_size,
+    def cast_rays(self) -> None:
+        """
+        Casts the rays of every screen column in one go and collects the walls to render.
+        """
+        table = game.projection
+        hits = game.ray_cache.cast(
+            game.chunks.walls,
+            self.start_x,
+            self.start_y,
+            self.angle,
+            table,
+            skip=game.chunks.skip,
+            max_dist=game.draw_distance,
+            version=game.chunks.version,
+        )
+        cols = np.flatnonzero(hits.hit)
+        dist = hits.dist[cols]
+        dist_px = dist * game.tile_size * table.fisheye[cols]
+        if self.cone_hits is not hits:
+            # the distance straight ahead, from a single probe ray
+            hit = cast_ray(
+                game.chunks.walls,
+                self.start_x,
+                self.start_y,
+                cos(self.angle),
+                sin(self.angle),
+                game.draw_distance,
             )
-            ray_mult = 1
-            dist *= ray_mult
-            dist_px = dist * game.tile_size * cos(offset)
-            if offset == 0:
-                player.wall_distance = dist_px
-            self.rays.append(((p1, p2), dist_px))
-            # init vars for walls
-            ww = display.width / game.ray_density
-            # wh = display.height * game.tile_size / dist_px * 1.7  # brute force
-            wh = (game.projection_dist / dist_px * display.height / 2) * (
-                60 / game.fov
-            )  # maths
-            wx = index * ww
-            wy = display.height / 2 - wh / 2 + self.view_yoffset
-            # texture calculations
-            cur_pix_x = cur_x * game.tile_size
-            cur_pix_y = cur_y * game.tile_size
-            tex_dx = round(p2[0] - cur_pix_x, 2)
-            tex_dy = round(p2[1] - cur_pix_y, 2)
-            if tex_dx == 0:
-                # col left, so hit - tile
-                tex_d = p2[1] - cur_pix_y
-                orien = 3  # left
-            elif tex_dx == game.tile_size:
-                # col right, so tile - hit
-                tex_d = p2[1] - cur_pix_y
-                orien = 1  # right
-            elif tex_dy == 0:
-                # col top, so size - (hit - tile)
-                tex_d = game.tile_size - (p2[0] - cur_pix_x)
-                orien = 0  # top
-            elif tex_dy == game.tile_size:
-                # col bottom, so hit - tile
-                tex_d = p2[0] - cur_pix_x
-                orien = 2  # bottom
-            # fill_rect(
-            #     [int(min(wh / display.height * 255, 255))] * 3 + [255],
-            #     pygame.FRect(wx, wy, ww, wh),
-            # )
-
-            # texture rendering
-
-            tex = gtex.wall_textures[tile_value]
-            axo = tex_d / game.tile_size * tex.width
-            tex.color = [int(min(wh * 2 / display.height * 255, 255))] * 3
-            # LSD SIMULATOR DONT DELETE
-            # tex.color = [
-            #     ((sin(ticks() * 0.01) + 1) / 2 * 255),
-            #     ((sin(ticks() * 0.01 + (1 / 3) * 2 * pi) + 1) / 2 * 255),
-            #     ((sin(ticks() * 0.01 + (2 / 3) * 2 * pi) + 1) / 2 * 255),
-            # ]
-            self.walls_to_render.append(
-                (
-                    dist_px,
-                    tex,
-                    pygame.Rect(wx, wy, ww, wh),
-                    pygame.Rect(axo, 0, 1, tex.height),
-                    tex.color,
+            if hit is not None:
+                player.wall_distance = hit[0] * game.tile_size
+            # view cone for the minimap, from a few evenly spread rays
+            rays = np.unique(np.linspace(0, len(table) - 1, self.cone_rays).astype(int))
+            # the rays that didn't hit anything end at the draw distance
+            ray_dist = np.where(hits.hit[rays], hits.dist[rays], game.draw_distance)
+            self.cone_points = list(
+                zip(
+                    ((self.start_x + ray_dist * hits.dx[rays]) * game.tile_size).tolist(),
+                    ((self.start_y + ray_dist * hits.dy[rays]) * game.tile_size).tolist(),
                 )
             )
-            # check whether the wall weapon is in the correct orientation
-            if len(obj) > 1:
-                if int(obj[1]) == orien:
-                    high = (cur_x, cur_y) in self.surround
-                    if high:
-                        lookup = gtex.highlighted_object_textures
-                        self.to_equip = ((cur_x, cur_y), obj)
-                    else:
-                        lookup = gtex.object_textures
-                    tex = lookup[int(obj[0])]
-                    tex.color = [int(min(wh * 2 / display.height * 255, 255))] * 3
-                    self.walls_to_render.append(
-                        (
-                            dist_px,
-                            tex,
-                            pygame.Rect(wx, wy, ww, wh),
-                            pygame.Rect(axo + high, 0, 1, tex.height),
-                            tex.color,
-                        )
-                    )
+            self.cone_hits = hits
+        self.cone = self.cone_points
+
+        # for clipping the enemies and for hit checks
+        self.depth = DepthBuffer(table, hits.dist * game.tile_size)
+
+        # the spans only change with the hits and the highlighted tiles
+        # (bob and recoil are applied when rendering)
+        spans_key = (
+            hits,
+            int(self.rect.x / game.tile_size),
+            int(self.rect.y / game.tile_size),
+        )
+        if spans_key != self.spans_key:
+            self.spans.clear()
+            self.queue_walls(hits, cols, dist_px)
+            self.spans_key = spans_key
+            self.spans_to_equip = self.to_equip
+        self.to_equip = self.spans_to_equip
+
+    def queue_walls(
+        self,
+        hits: ColumnHits,
+        cols: np.ndarray,
+        dist_px: np.ndarray,
+    ) -> None:
+        """
+        Queues the wall and wall weapon spans of the columns that hit a wall.
+        :param hits: the per-column hits
+        :param cols: the columns that hit a wall
+        :param dist_px: the distance to the wall of every column
+        """
+        table = game.projection
+        wh = table.height_scale / dist_px
+        wy = display.height / 2 - wh / 2
+        shades = np.minimum(wh * 2 / display.height * 255, 255)
+        shades *= fog(hits.dist[cols], game.draw_distance)
+        tiles = hits.tile[cols]
+        tile_x, tile_y = hits.tile_x[cols], hits.tile_y[cols]
+        oriens = hits.orien[cols]
+        axo = hits.u[cols] * gtex.wall_texture_widths[tiles]
+        face = (tile_x, tile_y, oriens)
+        self.queue_spans(
+            cols, face + (tiles,), wy, wh, shades, axo, tiles, gtex.wall_texture_widths, 0
+        )
+
+        # check whether the wall weapon is in the correct orientation
+        obj_cols = np.flatnonzero(game.chunks.oriens[tile_y, tile_x] == oriens)
+        if obj_cols.size:
+            weapons = game.chunks.weapons[tile_y, tile_x]
+            high = (np.abs(tile_x - int(self.rect.x / game.tile_size)) <= 1) & (
+                np.abs(tile_y - int(self.rect.y / game.tile_size)) <= 1
+            )
+            for highlighted, widths in (
+                (False, gtex.object_texture_widths),
+                (True, gtex.highlighted_object_texture_widths),
+            ):
+                sub = obj_cols[high[obj_cols] == highlighted]
+                if not sub.size:
+                    continue
+                if highlighted:
+                    ty, tx = tile_y[sub[-1]], tile_x[sub[-1]]
+                    self.to_equip = ((tx, ty), game.chunks.object_at(tx, ty))
+                self.queue_spans(
+                    cols[sub],
+                    tuple(key[sub] for key in face),
+                    wy[sub],
+                    wh[sub],
+                    shades[sub],
+                    axo[sub] + highlighted,
+                    weapons[sub],
+                    widths,
+                    1 + highlighted,
+                )
+
+    def queue_spans(
+        self,
+        cols: np.ndarray,
+        keys: tuple[np.ndarray, ...],
+        wy: np.ndarray,
+        wh: np.ndarray,
+        shades: np.ndarray,
+        texels: np.ndarray,
+        tex_ids: np.ndarray,
+        widths: np.ndarray,
+        stage: int,
+    ) -> None:
+        """
+        Merges neighbouring columns that hit the same face into one textured quad each.
+        :param cols: the screen columns that hit the face
+        :param keys: the values that must be equal across a span (tile, orientation, etc.)
+        :param wy: the top of the wall of every column
+        :param wh: the height of the wall of every column
+        :param shades: the distance shading of every column, from 0 to 255
+        :param texels: the horizontal texture coordinate of every column in texels
+        :param tex_ids: the texture index of every column
+        :param widths: the texture widths to index with tex_ids
+        :param stage: the order in which the quads are drawn (walls before objects)
+        """
+        # every span is drawn from one shade bucket of one mip level (see shade_atlas),
+        # picked so that a texel covers about a pixel
+        buckets = np.clip(
+            np.round(shades / 255 * (gtex.shade_buckets - 1)), 0, gtex.shade_buckets - 1
+        ).astype(np.int32)
+        lods = np.clip(
+            np.floor(np.log2(widths[tex_ids] / np.maximum(wh, 1))), 0, gtex.mip_levels - 1
+        ).astype(np.int8)
+        # a quad is drawn as two affinely mapped triangles, which kinks the texture by
+        # about a quarter of the height difference between its edges
+        starts, ends = find_spans(
+            cols, keys + (buckets, lods), ((texels, 1), (wy, 1)), ((wh, 4),)
+        )
+        if not starts.size:
+            return
+        counts = np.maximum(ends - starts, 1)
+        single = ends == starts
+        wb = wy + wh
+
+        def right(values: np.ndarray) -> np.ndarray:
+            # extrapolate one column further, so that the quad covers the last column
+            return values[ends] + (values[ends] - values[starts]) / counts
+
+        x1 = game.projection.column_x[cols[starts]]
+        x2 = game.projection.column_x[cols[ends]] + game.projection.column_width
+        u1 = np.where(single, np.floor(texels[starts]), texels[starts])
+        u2 = np.where(single, u1 + 1, right(texels))
+        # SDL refuses texture coordinates outside of the texture
+        widths = widths[tex_ids[starts]]
+        self.spans.append(
+            stage=stage,
+            tex_id=tex_ids[starts],
+            x1=x1,
+            x2=x2,
+            y1=wy[starts],
+            y2=right(wy),
+            b1=wb[starts],
+            b2=right(wb),
+            u1=np.clip(u1, 0, widths) / widths,
+            u2=np.clip(u2, 0, widths) / widths,
+            s1=shades[starts],
+            s2=np.clip(right(shades), 0, 255),
+            bucket=buckets[starts],
+            lod=lods[starts],
+        )
 
     def send_location(self) -> None:
         """
@@ -1559,7 +1888,6 @@ class Player:
             self.weapons[0] = weapon
             self.ammos[0] = weapon_data[weapon]["ammo"]
             self.mags[0] = weapon_data[weapon]["mag"]
-        hud.update_weapon_general(self)
 
     def update(self) -> None:
         """
@@ -1582,7 +1910,6 @@ class Player:
 
                     split = message.split("|")
                     self.health = max(self.health - int(split[2]), 0)
-                    hud.update_health(self)
 
                     if self.health <= 0:
                         client_tcp.req(f"kill|{self.id}")
@@ -1599,16 +1926,11 @@ class Player:
                     client_tcp.queue.remove(message)
                     game.set_state(States.MAIN_MENU)
 
-        self.rays = []
-        self.walls_to_render = []
+            leaderboard.set_stats(self.id, self.score, self.kills, self.deaths)
+
+        self.cone = []
         self.enemies_to_render = []
         self.keys()
-
-        for data in self.rays:
-            ray, _ = data
-            p1 = (ray[0][0] + game.mo, ray[0][1] + game.mo)
-            p2 = (ray[1][0] + game.mo, ray[1][1] + game.mo)
-            draw_line(Colors.GREEN, p1, p2)
         player.display_weapon()
 
 
@@ -1625,9 +1947,7 @@ class EnemyPlayer:
         self.kills = 0
         self.deaths = 0
         self.angle = radians(-90)  # TODO: Implement enemy direction
-        self.indicator_img = Image(
-            imgload("client", "assets", "images", "minimap", "player_arrow.png")
-        )
+        self.indicator_img = Image(gtex.arrow_img)
         self.indicator_img.color = Colors.ORANGE
         self.indicator_rect.center = (self.x, self.y)
         self.last_hit = ticks()
@@ -1675,26 +1995,26 @@ class EnemyPlayer:
                 self.deaths = message[self.id]["deaths"]
                 self.kills = message[self.id]["kills"]
                 self.score = message[self.id]["score"]
+                leaderboard.set_stats(self.id, self.score, self.kills, self.deaths)
 
         self.rendering = False
-        self.indicator_img.angle = degrees(self.angle)
-        display.renderer.blit(self.indicator_img, self.indicator_rect)
+        minimap.draw_marker(self.indicator_img, self.x, self.y, self.angle)
 
     def update(self) -> None:
         """
         Updates the enemy by drawing it, checking for deaths and regenerating it
         """
         self.x += self.xvel
-        for rect in game.rect_list:
-            if rect is not None and self.indicator_rect.colliderect(rect):
+        for rect in game.chunks.rects_near(self.indicator_rect):
+            if self.indicator_rect.colliderect(rect):
                 if self.xvel >= 0:
                     self.x = rect.left - self.indicator_rect.width / 2
                 else:
                     self.x = rect.right + self.indicator_rect.width / 2
                 self.xvel *= -1
         self.y += self.yvel
-        for rect in game.rect_list:
-            if rect is not None and self.indicator_rect.colliderect(rect):
+        for rect in game.chunks.rects_near(self.indicator_rect):
+            if self.indicator_rect.colliderect(rect):
                 if self.yvel >= 0:
                     self.y = rect.top - self.indicator_rect.height / 2
                 else:
@@ -1728,9 +2048,7 @@ class EnemyPlayer:
             diff2 = angle_diff(angle, end_angle)
             ratio = (diff1) / (diff1 + diff2)
             centerx = ratio * display.width
-            wall_height = (game.projection_dist / self.dist_px * display.height / 2) / (
-                game.fov / 60
-            )  # maths
+            wall_height = game.projection.height_scale / self.dist_px  # maths
             size_mult = 0.8
             centery = (
                 display.height / 2 + player.view_yoffset + wall_height * (1 - size_mult)
@@ -1806,8 +2124,28 @@ class EnemyPlayer:
                 self.image = self.images[2]
             elif -eighth <= angle < eighth:
                 self.image = self.images[3]
-            # render
-            display.renderer.blit(self.image, self.rect)
+            brightness = fog(self.dist_px / game.tile_size, game.draw_distance)
+            if framebuffer is not None:
+                framebuffer.render_sprite(
+                    self.images.index(self.image), self.rect, self.dist_px, brightness
+                )
+            else:
+                self.image.color = (int(brightness * 255),) * 3
+                # render the slices that aren't behind a wall
+                for left, right in player.depth.visible_runs(
+                    self.rect.left, self.rect.right, self.dist_px
+                ):
+                    tex_left = (
+                        (left - self.rect.left) / self.rect.width * self.image.width
+                    )
+                    tex_right = (
+                        (right - self.rect.left) / self.rect.width * self.image.width
+                    )
+                    self.image.draw(
+                        srcrect=(tex_left, 0, tex_right - tex_left, self.image.height),
+                        dstrect=(left, self.rect.top, right - left, self.rect.height),
+                    )
+                    game.draw_calls += 1
             """ show hitboxes
             draw_rect(Colors.YELLOW, self.rect)
             fill_rect(Colors.ORANGE, self.head_rect)
@@ -1843,7 +2181,9 @@ class EnemyPlayer:
                 enemies.remove(self)
                 player.score += 200
                 player.kills += 1
-                hud.update_score()
+                leaderboard.set_stats(
+                    player.id, player.score, player.kills, player.deaths
+                )
                 new_enemy()
 
     def die(self) -> None:
@@ -1851,7 +2191,7 @@ class EnemyPlayer:
         Attempts to kill the player
         """
         try:
-            del leaderboard.texs[self.id]
+            leaderboard.remove(self.id)
             enemies.remove(self)
         except:
             pass
@@ -1991,14 +2331,20 @@ shots: list[Shot] = []
 clock = pygame.time.Clock()
 joystick: pygame.joystick.JoystickType = None
 
-crosshair_tex = imgload("client", "assets", "images", "hud", "crosshair.png", scale=3)
+crosshair_tex = imgload(
+    "client", "assets", "images", "hud", "crosshair.png", scale=3, packed=True
+)
 crosshair_rect = crosshair_tex.get_rect(center=(display.center))
 
-wasd_image = imgload("client", "assets", "images", "controls", "WASD.png", scale=0.5 if display.fullscreen else 0.3)
-e_image = imgload("client", "assets", "images", "controls", "E.png", scale=0.5 if display.fullscreen else 0.3)
-q_image = imgload("client", "assets", "images", "controls", "Q.png", scale=0.5 if display.fullscreen else 0.3)
-tab_image = imgload("client", "assets", "images", "controls", "TAB.png", scale=0.5 if display.fullscreen else 0.3)
+wasd_image = imgload("client", "assets", "images", "controls", "WASD.png", scale=0.5 if display.fullscreen else 0.3, packed=True)
+e_image = imgload("client", "assets", "images", "controls", "E.png", scale=0.5 if display.fullscreen else 0.3, packed=True)
+q_image = imgload("client", "assets", "images", "controls", "Q.png", scale=0.5 if display.fullscreen else 0.3, packed=True)
+tab_image = imgload("client", "assets", "images", "controls", "TAB.png", scale=0.5 if display.fullscreen else 0.3, packed=True)
 controls_images = [wasd_image, e_image, q_image, tab_image]
+controls_outline = pygame.Rect(display.width / 2 - 400, display.height/7, 800, display.height * 5 / 7)
+controls_black_surf = pygame.Surface(controls_outline.size, pygame.SRCALPHA)
+controls_black_surf.fill((0, 0, 0, 120))
+controls_black_tex = Texture.from_surface(display.renderer, controls_black_surf)
 
 title = Button(
     int(display.width / 2),
@@ -2041,6 +2387,15 @@ main_settings_buttons = [
     Button(
         80,
         display.height / 2 + 48 * 2,
+        "Draw distance",
+        game.set_draw_distance,
+        action_arg=16,
+        is_slider=True,
+        slider_display=game.get_draw_distance,
+    ),
+    Button(
+        80,
+        display.height / 2 + 48 * 3,
         "Volume",
         game.set_volume,
         action_arg=5,
@@ -2049,7 +2404,7 @@ main_settings_buttons = [
     ),
     Button(
         80,
-        display.height / 2 + 48 * 3,
+        display.height / 2 + 48 * 4,
         "Max FPS",
         game.set_max_fps,
         action_arg=1,
@@ -2058,7 +2413,16 @@ main_settings_buttons = [
     ),
     Button(
         80,
-        display.height / 2 + 48 * 4,
+        display.height / 2 + 48 * 5,
+        "Render scale",
+        game.set_render_scale,
+        action_arg=25,
+        is_slider=True,
+        slider_display=game.get_render_scale,
+    ),
+    Button(
+        80,
+        display.height / 2 + 48 * 6,
         "Back",
         lambda: game.set_state(game.previous_state),
         font_size=48,
@@ -2121,16 +2485,16 @@ all_buttons = {
     ],
     States.MAIN_SETTINGS: main_settings_buttons,
     States.PLAY_SETTINGS: [
-        *main_settings_buttons[0:6],
+        *main_settings_buttons[0:8],
         Button(
             80,
-            display.height / 2 + 48 * 4,
+            display.height / 2 + 48 * 6,
             "Return to main menu",
             lambda: print(game.set_state(States.MAIN_MENU), "here 4"),
         ),
         Button(
             80,
-            display.height / 2 + 48 * 5,
+            display.height / 2 + 48 * 7,
             "Back",
             lambda: game.set_state(game.previous_state),
             font_size=48,
@@ -2183,12 +2547,15 @@ menu_wall_texs = imgload(
     frames=8,
 )
 
-floor_tex = imgload("client", "assets", "images", "3d", "floor.png")
 joystick_button_sprs = imgload(
-    "client", "assets", "images", "hud", "buttons.png", scale=4, frames=4
+    "client", "assets", "images", "hud", "buttons.png", scale=4, frames=4, packed=True
 )
 joystick_button_rect = joystick_button_sprs[0].get_rect()
 
+# every packed image is loaded by now
+if "--dump-atlases" in sys.argv:
+    texture_atlas.dump(Path("atlases"))
+
 
 def add_enemy(address: str, data: Dict[str, Any]) -> None:
     """
@@ -2209,22 +2576,348 @@ def add_enemy(address: str, data: Dict[str, Any]) -> None:
     )
 
     enemies.append(new_enemy)
-    leaderboard.texs[new_enemy.id] = (text2tex(new_enemy.name, 32), None)
+    leaderboard.add(new_enemy.id, new_enemy.name)
 
 
-def render_floor() -> None:
+def surfaces_to_texels(
+    surfaces: list[pygame.Surface | None], levels: int = 64
+) -> tuple[np.ndarray, np.ndarray]:
     """
-    renders floor
+    Shades and packs images for the software renderer, padded to the largest one.
+    :param surfaces: the images, where None is an empty one
+    :param levels: the number of shade levels (see shade_texels)
+    :return: the shaded texels and the width and the height of every image
     """
-    fill_rect(
-        Colors.BROWN,
-        (
-            0,
-            display.height / 2 + player.view_yoffset,
-            display.width,
-            display.height / 2 - player.view_yoffset,
-        ),
+    sizes = np.array(
+        [surf.get_size() if surf is not None else (1, 1) for surf in surfaces]
     )
+    width, height = sizes.max(axis=0)
+    pixels = np.zeros((len(surfaces), height, width, 4), dtype=np.uint8)
+    for index, surf in enumerate(surfaces):
+        if surf is None:
+            continue
+        # blitting onto a transparent surface turns colorkeys into alpha as well
+        w, h = surf.get_size()
+        rgba = pygame.Surface((w, h), pygame.SRCALPHA)
+        rgba.blit(surf, (0, 0))
+        pixels[index, :h, :w, :3] = pygame.surfarray.array3d(rgba).transpose(1, 0, 2)
+        pixels[index, :h, :w, 3] = pygame.surfarray.array_alpha(rgba).T
+    return shade_texels(pixels, levels), sizes
+
+
+class Planes:
+    def __init__(self) -> None:
+        self.key = None
+        self.tex = None
+        self.rows = None
+
+    def render(self) -> None:
+        """
+        Renders the textured floor and ceiling, with one texel per ray and row.
+        """
+        rows, top = self.cast()
+        self.present(rows, top)
+
+    def cast(self) -> tuple[int, float]:
+        """
+        Casts the floor and the ceiling into the rows, which then cover the whole screen.
+        :return: the number of rows and the screen y coordinate of the top of the first one
+        """
+        table = game.projection
+        if self.key != table.key:
+            # one row is as tall as a column is wide, and the horizon may sit between two rows
+            rows = ceil(display.height / table.column_width) + 1
+            columns = len(table) - 1
+            self.rows = np.zeros((rows, columns), dtype=np.uint32)
+            self.tex = Texture(display.renderer, (columns, rows), streaming=True)
+            self.key = table.key
+        horizon = display.height / 2 + player.view_yoffset
+        ceiling_rows, floor_rows = cast_planes(
+            game.chunks.floor,
+            gtex.floor_texels,
+            gtex.ceiling_texels,
+            player.start_x,
+            player.start_y,
+            player.angle,
+            table,
+            game.tile_size,
+            horizon,
+            display.height,
+            self.rows,
+            game.draw_distance,
+        )
+        return ceiling_rows + floor_rows, horizon - ceiling_rows * table.column_width
+
+    def present(self, rows: int, top: float) -> None:
+        """
+        Uploads the rows to the streaming texture and draws it.
+        :param rows: the number of rows to draw
+        :param top: the screen y coordinate of the top of the first row
+        """
+        if not rows:
+            return
+        columns = self.rows.shape[1]
+        surf = pygame.image.frombuffer(self.rows[:rows], (columns, rows), "RGBX")
+        self.tex.update(surf, (0, 0, columns, rows))
+        self.tex.draw(
+            srcrect=(0, 0, columns, rows),
+            dstrect=(0, top, display.width, rows * game.projection.column_width),
+        )
+
+
+class Framebuffer:
+    def __init__(self) -> None:
+        # the wall, wall weapon and highlighted wall weapon textures, indexed by span stage
+        wall = pygame.image.load(Path("client", "assets", "images", "3d", "wall.png"))
+        floor = pygame.image.load(Path("client", "assets", "images", "3d", "floor.png"))
+        weapons = [
+            (
+                pygame.image.load(
+                    Path("client", "assets", "images", "objects", file_name + ".png")
+                )
+                if file_name is not None and file_name not in ("Knife", "Pistol")
+                else None
+            )
+            for file_name in weapon_names
+        ]
+        self.stages = [
+            surfaces_to_texels(
+                [None]
+                + [pygame.transform.scale_by(surf, 0.25) for surf in (wall, floor)]
+            ),
+            surfaces_to_texels(weapons),
+            surfaces_to_texels(
+                [
+                    borderize(surf, Colors.YELLOW) if surf is not None else None
+                    for surf in weapons
+                ]
+            ),
+        ]
+        # the enemies aren't shaded, so only the full brightness level is kept
+        enemies = imgload(
+            "client", "assets", "images", "3d", "player.png", frames=4, to_tex=False
+        )
+        # the enemies aren't shaded, only faded out by the fog
+        self.enemy_texels = surfaces_to_texels(enemies, levels=16)[0]
+        self.rows = 0
+        self.top = 0
+
+    @property
+    def pixels(self) -> np.ndarray:
+        return planes.rows[: self.rows]
+
+    def render_walls(self, spans: SpanBuffer, yoffset: float) -> None:
+        """
+        Casts the floor and the ceiling and draws the queued walls over them.
+        :param spans: the queued wall and wall weapon spans
+        :param yoffset: the view offset, which the spans are queued without
+        """
+        self.rows, self.top = planes.cast()
+        order = spans.order()
+        columns = self.pixels.shape[1]
+        for stage, (texels, sizes) in enumerate(self.stages):
+            indices = order[spans.stage[order] == stage]
+            if not indices.size:
+                continue
+            cols, owner, y1, y2, u, shades = span_columns(
+                spans, indices, game.projection.column_width, columns
+            )
+            draw_columns(
+                self.pixels,
+                self.top - yoffset,
+                game.projection.column_width,
+                cols,
+                y1,
+                y2,
+                u,
+                shades,
+                spans.tex_id[owner],
+                texels,
+                sizes,
+            )
+
+    def render_sprite(
+        self, frame: int, rect: pygame.Rect, dist: float, brightness: float = 1
+    ) -> None:
+        """
+        Draws an enemy where no wall is in front of it.
+        :param frame: the direction frame of the enemy image
+        :param rect: the screen rect of the enemy
+        :param dist: the distance to the enemy
+        :param brightness: how much the enemy is faded out by the fog, from 0 to 1
+        """
+        level = int(brightness * (len(self.enemy_texels) - 1) + 0.5)
+        draw_sprite(
+            self.pixels,
+            self.top,
+            game.projection.column_width,
+            game.projection.column_width,
+            rect,
+            self.enemy_texels[level, frame],
+            player.depth.depth,
+            dist,
+        )
+
+    def present(self) -> None:
+        """
+        Draws the whole 3D view with a single texture.
+        """
+        planes.present(self.rows, self.top)
+        game.draw_calls = 1
+
+
+class SceneTarget:
+    def __init__(self) -> None:
+        self.tex = None
+        self.size = None
+
+    def begin(self) -> None:
+        """
+        Redirects the drawing to the offscreen texture if the render scale is below 100%.
+        The coordinates stay in window pixels, the renderer scales them down.
+        """
+        if game.render_scale >= 100:
+            return
+        scale = game.render_scale / 100
+        size = (ceil(display.width * scale), ceil(display.height * scale))
+        if self.size != size:
+            self.tex = Texture(display.renderer, size, target=True)
+            self.size = size
+        display.renderer.target = self.tex
+        display.renderer.draw_color = Colors.BLACK
+        display.renderer.clear()
+        display.renderer.scale = (size[0] / display.width, size[1] / display.height)
+
+    def end(self) -> None:
+        """
+        Draws the offscreen texture upscaled to the window, so that the hud stays sharp.
+        """
+        if display.renderer.target is None:
+            return
+        display.renderer.target = None
+        display.renderer.scale = (1, 1)
+        # textures are sampled with the nearest pixel unless SDL is told otherwise
+        self.tex.draw(dstrect=(0, 0, display.width, display.height))
+
+
+class Minimap:
+    def __init__(self) -> None:
+        size = int(display.height * 0.3)
+        self.rect = pygame.Rect(0, 0, size, size)
+        # pixels of the minimap per pixel of the map
+        self.zooms = (0.5, 1, 2)
+        self.zoom_index = game.minimap_zoom
+        self.rotate = game.minimap_rotate
+        # the map position at the center of the minimap, and how much the map is turned
+        self.center = (0, 0)
+        self.angle = 0
+
+    @property
+    def zoom(self) -> float:
+        return self.zooms[self.zoom_index]
+
+    def next_zoom(self) -> None:
+        self.zoom_index = (self.zoom_index + 1) % len(self.zooms)
+        game.minimap_zoom = self.zoom_index
+
+    def toggle_rotate(self) -> None:
+        self.rotate = not self.rotate
+        game.minimap_rotate = self.rotate
+
+    def follow(self, x: float, y: float, angle: float) -> None:
+        """
+        Centers the minimap on a position and, if it rotates, turns the direction up.
+        :param x: the x position in map pixels
+        :param y: the y position in map pixels
+        :param angle: the direction in radians
+        """
+        self.center = (x, y)
+        self.angle = -angle - pi / 2 if self.rotate else 0
+
+    def to_screen(self, x: float, y: float) -> tuple[float, float]:
+        """
+        Converts a position on the map to the minimap, relative to its top left.
+        :param x: the x position in map pixels
+        :param y: the y position in map pixels
+        :return: the position on the minimap
+        """
+        dx, dy = (x - self.center[0]) * self.zoom, (y - self.center[1]) * self.zoom
+        c, s = cos(self.angle), sin(self.angle)
+        return (
+            self.rect.width / 2 + dx * c - dy * s,
+            self.rect.height / 2 + dx * s + dy * c,
+        )
+
+    def begin(self) -> None:
+        """
+        Clips the drawing to the minimap, whose top left becomes the origin.
+        """
+        display.renderer.set_viewport(self.rect)
+
+    def end(self) -> None:
+        """
+        Draws to the whole screen again.
+        """
+        display.renderer.set_viewport(None)
+
+    def render(self) -> None:
+        """
+        Renders the chunks of the map around the center, which only get drawn the first time
+        they are shown.
+        """
+        fill_rect(Colors.BLACK, self.rect)
+        self.begin()
+        chunks = game.chunks
+        chunk_px = chunks.chunk_px
+        # the corners of the minimap reach further when it is turned
+        reach = ceil(self.rect.width / 2 * sqrt(2) / self.zoom)
+        area = pygame.Rect(0, 0, 2 * reach, 2 * reach)
+        area.center = (int(self.center[0]), int(self.center[1]))
+        for cx, cy in chunks.chunks_in(area):
+            tex = chunks.chunk_texture(cx, cy)
+            x, y = self.to_screen(cx * chunk_px, cy * chunk_px)
+            # turned around its top left corner, which is where it is put
+            tex.draw(
+                dstrect=(x, y, tex.width * self.zoom, tex.height * self.zoom),
+                angle=degrees(self.angle),
+                origin=(0, 0),
+            )
+        if game.debug_map:
+            for x in range(area.left // game.tile_size, area.right // game.tile_size + 1):
+                draw_line(
+                    Colors.WHITE,
+                    self.to_screen(x * game.tile_size, area.top),
+                    self.to_screen(x * game.tile_size, area.bottom),
+                )
+            for y in range(area.top // game.tile_size, area.bottom // game.tile_size + 1):
+                draw_line(
+                    Colors.WHITE,
+                    self.to_screen(area.left, y * game.tile_size),
+                    self.to_screen(area.right, y * game.tile_size),
+                )
+        self.end()
+
+    def draw_marker(self, img: Image, x: float, y: float, angle: float) -> None:
+        """
+        Draws a direction marker (e.g. a player arrow) on the minimap.
+        :param img: the marker, pointing right
+        :param x: the x position in map pixels
+        :param y: the y position in map pixels
+        :param angle: the direction in radians
+        """
+        img.angle = degrees(angle + self.angle)
+        rect = pygame.FRect(0, 0, 16 * self.zoom, 16 * self.zoom)
+        rect.center = self.to_screen(x, y)
+        self.begin()
+        img.draw(dstrect=rect)
+        self.end()
+
+
+planes = Planes()
+scene_target = SceneTarget()
+minimap = Minimap()
+# --software-render composites the 3D view in numpy instead of drawing every span
+framebuffer = Framebuffer() if "--software-render" in sys.argv else None
 
 
 def main(multiplayer) -> None:
@@ -2365,6 +3058,14 @@ def main(multiplayer) -> None:
                         case pygame.K_q:
                             player.process_melee = True
 
+                        case pygame.K_m:
+                            if game.state == States.PLAY:
+                                minimap.next_zoom()
+
+                        case pygame.K_n:
+                            if game.state == States.PLAY:
+                                minimap.toggle_rotate()
+
                 case pygame.JOYDEVICEADDED:
                     joystick = pygame.joystick.Joystick(event.device_index)
 
@@ -2408,8 +3109,13 @@ def main(multiplayer) -> None:
                             Joymap.PRESSED["RIGHT_TRIGGER"] = False
                         Joymap.CACHE["RIGHT_TRIGGER"] = event.value
 
-            for button in current_buttons:
-                button.process_event(event)
+            if event.type in (
+                pygame.MOUSEMOTION,
+                pygame.MOUSEBUTTONDOWN,
+                pygame.MOUSEWHEEL,
+            ):
+                for button in current_buttons:
+                    button.process_event(event)
 
         display.renderer.clear()
 
@@ -2429,12 +3135,6 @@ def main(multiplayer) -> None:
             username_input.update()
 
         if game.state == States.CONTROLS:
-            controls_outline = pygame.Rect(display.width / 2 - 400, display.height/7, 800, display.height * 5 / 7)
-            controls_black_surf = pygame.Surface(controls_outline.size, pygame.SRCALPHA)
-            controls_black_surf.fill((0, 0, 0, 120))
-            controls_black_tex = Texture.from_surface(
-                display.renderer, controls_black_surf
-            )
             display.renderer.blit(controls_black_tex, controls_outline)
             index = 1
             for img in controls_images:
@@ -2461,11 +3161,6 @@ def main(multiplayer) -> None:
                 index += 1
 
         if game.state in (States.PLAY, States.PLAY_SETTINGS, States.GAME_OVER):
-            fill_rect(
-                Colors.DARK_GRAY,
-                (0, 0, display.width, display.height / 2 + player.view_yoffset),
-            )
-            render_floor()
             # display.renderer.blit(sky_tex, sky_rect)
 
             player.update()
@@ -2476,7 +3171,6 @@ def main(multiplayer) -> None:
 
             hud.update()
 
-            display.renderer.blit(redden_game.tex, redden_game.rect)
             for shot in shots:
                 shot.update()
         
@@ -2500,15 +3194,19 @@ def main(multiplayer) -> None:
         if cursor.enabled:
             cursor.update()
 
+        fps_text = f"{int(clock.get_fps())} FPS"
+        if game.dynamic_res:
+            fps_text += f" | {game.ray_density} rays"
         write(
             "topright",
-            f"{int(clock.get_fps())} FPS",
+            fps_text,
             v_fonts[20],
             Colors.WHITE,
             display.width - 5,
             5,
         )
 
+        text_cache.end_frame()
         display.renderer.present()
 
     sys.exit()
@@ -0,0 +1,143 @@
+import numpy as np
+
+from .raycast import SpanBuffer
+
+
+def span_columns(
+    spans: SpanBuffer, indices: np.ndarray, column_width: float, columns: int
+) -> tuple[np.ndarray, ...]:
+    """
+    Splits spans back into the framebuffer columns whose centers they cover.
+    :param spans: the queued spans
+    :param indices: the spans to split
+    :param column_width: the width of a framebuffer column in screen pixels
+    :param columns: the number of framebuffer columns
+    :return: the column and the span of every strip, and its interpolated top, bottom,
+    horizontal texture coordinate (from 0 to 1) and shade
+    """
+    x1, x2 = spans.x1[indices], spans.x2[indices]
+    first = np.clip(np.ceil(x1 / column_width - 0.5), 0, columns).astype(np.intp)
+    last = np.clip(np.ceil(x2 / column_width - 0.5), 0, columns).astype(np.intp)
+    counts = np.maximum(last - first, 0)
+    owner = np.repeat(np.arange(len(indices)), counts)
+    cols = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cols += first[owner]
+    # the span values belong to the left edges of its first and its next column
+    t = ((cols + 0.5) * column_width - x1[owner]) / (x2 - x1)[owner]
+
+    def lerp(start: np.ndarray, end: np.ndarray) -> np.ndarray:
+        start = start[indices][owner]
+        return start + (end[indices][owner] - start) * t
+
+    return (
+        cols,
+        indices[owner],
+        lerp(spans.y1, spans.y2),
+        lerp(spans.b1, spans.b2),
+        lerp(spans.u1, spans.u2),
+        lerp(spans.s1, spans.s2),
+    )
+
+
+def draw_columns(
+    out: np.ndarray,
+    top: float,
+    row_height: float,
+    cols: np.ndarray,
+    y1: np.ndarray,
+    y2: np.ndarray,
+    u: np.ndarray,
+    shades: np.ndarray,
+    tex_ids: np.ndarray,
+    texels: np.ndarray,
+    sizes: np.ndarray,
+) -> None:
+    """
+    Draws one textured vertical strip per column, leaving out the transparent texels.
+    :param out: the framebuffer rows of packed pixels, of shape (rows, columns)
+    :param top: the screen y coordinate of the top of the first row
+    :param row_height: the height of a row in screen pixels
+    :param cols: the column of every strip
+    :param y1: the screen y coordinate of the top of every strip
+    :param y2: the screen y coordinate of the bottom of every strip
+    :param u: the horizontal texture coordinate of every strip, from 0 to 1
+    :param shades: the distance shading of every strip, from 0 to 255
+    :param tex_ids: the texture index of every strip
+    :param texels: the shaded textures (see shade_texels), padded to the largest one
+    :param sizes: the width and the height of every texture
+    """
+    levels, textures, height, width = texels.shape
+    rows = len(out)
+    first = np.clip(np.ceil((y1 - top) / row_height - 0.5), 0, rows).astype(np.intp)
+    last = np.clip(np.ceil((y2 - top) / row_height - 0.5), 0, rows).astype(np.intp)
+    counts = np.maximum(last - first, 0)
+    owner = np.repeat(np.arange(len(cols)), counts)
+    row = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    row += first[owner]
+
+    # everything that is the same along a strip is looked up once per strip
+    tex_w, tex_h = sizes[tex_ids, 0], sizes[tex_ids, 1]
+    texel_x = np.clip((u * tex_w).astype(np.intp), 0, tex_w - 1)
+    level = np.clip((shades / 255 * (levels - 1) + 0.5).astype(np.intp), 0, levels - 1)
+    base = (level * textures + tex_ids) * height
+    scale = tex_h / (y2 - y1)
+
+    texel_y = ((top + (row + 0.5) * row_height - y1[owner]) * scale[owner]).astype(
+        np.intp
+    )
+    np.clip(texel_y, 0, tex_h[owner] - 1, out=texel_y)
+    pixels = texels.ravel().take((base[owner] + texel_y) * width + texel_x[owner])
+    opaque = pixels >> 24 >= 128
+    out.reshape(-1)[(row * out.shape[1] + cols[owner])[opaque]] = pixels[opaque]
+
+
+def draw_sprite(
+    out: np.ndarray,
+    top: float,
+    row_height: float,
+    column_width: float,
+    rect: tuple[float, float, float, float],
+    texels: np.ndarray,
+    depth: np.ndarray,
+    dist: float,
+) -> None:
+    """
+    Draws an image scaled to a screen rect, in the columns where no wall is in front.
+    :param out: the framebuffer rows of packed pixels, of shape (rows, columns)
+    :param top: the screen y coordinate of the top of the first row
+    :param row_height: the height of a row in screen pixels
+    :param column_width: the width of a column in screen pixels
+    :param rect: the screen rect of the image
+    :param texels: the packed image (see shade_texels), of shape (height, width)
+    :param depth: the distance to the wall along every column
+    :param dist: the distance to the image
+    """
+    left, rect_top, rect_width, rect_height = rect
+    rows, columns = out.shape
+    c1, c2 = np.clip(
+        np.ceil(np.array((left, left + rect_width)) / column_width - 0.5), 0, columns
+    ).astype(np.intp)
+    r1, r2 = np.clip(
+        np.ceil(
+            (np.array((rect_top, rect_top + rect_height)) - top) / row_height - 0.5
+        ),
+        0,
+        rows,
+    ).astype(np.intp)
+    if c1 >= c2 or r1 >= r2:
+        return
+    cols = np.arange(c1, c2)
+    cols = cols[depth[cols] >= dist]
+    if not cols.size:
+        return
+    height, width = texels.shape
+    texel_x = ((cols + 0.5) * column_width - left) / rect_width * width
+    texel_y = (
+        (top + (np.arange(r1, r2) + 0.5) * row_height - rect_top) / rect_height * height
+    )
+    pixels = texels[
+        np.clip(texel_y.astype(np.intp), 0, height - 1)[:, None],
+        np.clip(texel_x.astype(np.intp), 0, width - 1),
+    ]
+    block = out[r1:r2, cols]
+    out[r1:r2, cols] = np.where(pixels >> 24 >= 128, pixels, block)
@@ -1,7 +1,8 @@
+from collections import OrderedDict
 from enum import Enum
-from math import sin, cos, atan2, e, pi
+from math import sin, cos, atan2, e, pi, ceil
 from pathlib import Path
-from pygame._sdl2.video import Window, Renderer, Texture
+from pygame._sdl2.video import Window, Renderer, Texture, Image
 from typing import Any, Optional, TypeAlias
 import time
 import csv
@@ -96,16 +97,50 @@ class Directions(Enum):
     UP_LEFT = 7
 
 
-v_fonts = [
-    pygame.font.Font(Path("client", "assets", "fonts", "VT323-Regular.ttf"), i)
-    for i in range(101)
-]
-vi_fonts = [
-    pygame.font.Font(
-        Path("client", "assets", "fonts", "VT323-Regular.ttf", italic=True), i
-    )
-    for i in range(101)
-]
+class FontCache:
+    def __init__(self, path: Path, max_fonts: int = 32) -> None:
+        self.path = path
+        self.max_fonts = max_fonts
+        # the opened fonts, the least recently used one first
+        self.fonts: OrderedDict[tuple[int, bool, bool], pygame.Font] = OrderedDict()
+
+    def get(self, size: int, bold: bool = False, italic: bool = False) -> pygame.Font:
+        """
+        Gives the font in a size and style, opening it the first time it is used.
+        :param size: the font size
+        :param bold: whether the font is bold
+        :param italic: whether the font is italic
+        :return: the font
+        """
+        key = (size, bold, italic)
+        if key in self.fonts:
+            self.fonts.move_to_end(key)
+            return self.fonts[key]
+        font = pygame.font.Font(self.path, size)
+        font.bold = bold
+        font.italic = italic
+        self.fonts[key] = font
+        while len(self.fonts) > self.max_fonts:
+            # the text cache would otherwise keep the closed font and its glyphs alive
+            text_cache.forget(self.fonts.popitem(last=False)[1])
+        return font
+
+
+class FontSizes:
+    def __init__(
+        self, cache: FontCache, bold: bool = False, italic: bool = False
+    ) -> None:
+        self.cache = cache
+        self.bold = bold
+        self.italic = italic
+
+    def __getitem__(self, size: int) -> pygame.Font:
+        return self.cache.get(size, self.bold, self.italic)
+
+
+fonts = FontCache(Path("client", "assets", "fonts", "VT323-Regular.ttf"))
+v_fonts = FontSizes(fonts)
+vi_fonts = FontSizes(fonts, italic=True)
 
 
 class UserInput:
@@ -178,6 +213,8 @@ class Display:
         if self.fullscreen:
             self.window.set_fullscreen()
 
+        # queue draw calls instead of flushing each one, even when a render driver is forced
+        os.environ.setdefault("SDL_RENDER_BATCHING", "1")
         self.renderer = Renderer(self.window, vsync=vsync)
 
 
@@ -276,23 +313,47 @@ class Button:
                     False,
                 ),
             )
-            self.right_slider_rect = self.right_slider_tex.get_rect()
+            self.right_slider_rect = self.right_slider_tex.get_rect(
+                midleft=(self.rect.right + 15 + 40 + 15, self.rect.centery)
+            )
+            self.left_slider_rect.center = (self.rect.right + 15, self.rect.centery)
+
+        # the label and the slider value stay rendered until they change
+        self.hovered = False
+        self.label_tex: Optional[Texture] = None
+        self.label_key: Optional[tuple] = None
+        self.value_tex: Optional[Texture] = None
+        self.value_key: Any = None
 
     @property
     def grayed_out(self):
         return self.grayed_out_when is not None and self.grayed_out_when()
 
+    def hover(self, pos: tuple[int, int]) -> None:
+        """
+        Checks whether the mouse is over the button, which only changes when it moves.
+        :param pos: the mouse position
+        """
+        self.hovered = (
+            self.action is not None
+            and not self.is_slider
+            and self.rect.collidepoint(pos)
+        )
+
     def process_event(self, event):
         if self.action is not None:
+            if event.type == pygame.MOUSEMOTION:
+                self.hover(event.pos)
+
             if event.type == pygame.MOUSEBUTTONDOWN:
                 if event.button == 1:
                     if self.is_slider:
-                        if self.left_slider_rect.collidepoint(pygame.mouse.get_pos()):
+                        if self.left_slider_rect.collidepoint(event.pos):
                             self.action(-self.action_arg)
-                        if self.right_slider_rect.collidepoint(pygame.mouse.get_pos()):
+                        if self.right_slider_rect.collidepoint(event.pos):
                             self.action(self.action_arg)
 
-                    elif self.rect.collidepoint(pygame.mouse.get_pos()):
+                    elif self.rect.collidepoint(event.pos):
                         if not self.grayed_out:
                             self.action()
 
@@ -307,63 +368,42 @@ class Button:
                         self.action(event.y * self.action_arg)
 
     def update(self):
-        if (
-            self.rect.collidepoint(pygame.mouse.get_pos())
-            and not self.is_slider
-            and self.action is not None
-            and not self.grayed_out
-        ):
+        grayed_out = self.grayed_out
+        if self.hovered and not grayed_out:
             display.renderer.blit(self.hover_tex, self.hover_rect)
         if self.should_background:
             fill_rect(Colors.GRAY, self.rect)
         if self.is_slider:
             display.renderer.blit(self.left_slider_tex, self.left_slider_rect)
             display.renderer.blit(self.right_slider_tex, self.right_slider_rect)
-            self.slider_display_rect = write(
-                "center",
-                self.slider_display(),
-                v_fonts[self.font_size],
-                Colors.WHITE,
-                self.rect.right + 45,
-                self.rect.centery,
-            )[1]
-
-            setattr(
-                self.right_slider_rect,
-                "midleft",
-                (
-                    self.rect.right + 15 + 40 + 15,
-                    self.rect.centery,
-                ),
-            )
-            setattr(
-                self.left_slider_rect,
-                "center",
-                (
-                    self.rect.right + 15,
-                    self.rect.centery,
-                ),
+            value = self.slider_display()
+            if value != self.value_key:
+                self.value_key = value
+                self.value_tex = text2tex(value, self.font_size)
+                self.value_rect = self.value_tex.get_rect(
+                    center=(self.rect.right + 45, self.rect.centery)
+                )
+            display.renderer.blit(self.value_tex, self.value_rect)
+
+        label_key = (self.content, self.color)
+        if label_key != self.label_key:
+            self.label_key = label_key
+            self.label_tex = Texture.from_surface(
+                display.renderer, self.font.render(self.content, True, self.color)
             )
-        tex, rect = write(
-            "topleft",
-            self.content,
-            v_fonts[self.font_size],
-            self.color,
-            self.rect.x,
-            self.rect.y,
-            blit=False,
-        )
-        if self.grayed_out:
-            tex.color = (80, 80, 80, 255)
-        display.renderer.blit(tex, rect)
+            self.label_rect = self.label_tex.get_rect(topleft=self.rect.topleft)
+        self.label_tex.color = (80, 80, 80, 255) if grayed_out else Colors.WHITE
+        display.renderer.blit(self.label_tex, self.label_rect)
 
 
 display = Display(
     1280,
     720,
     "PANDEMONIUM",
-    fullscreen=not any(x in sys.argv for x in ("--no-fullscreen", "-f", "-fm", "-mf")),
-    vsync=False if "--no-vsync" in sys.argv else True,
+    fullscreen=not any(
+        x in sys.argv for x in ("--no-fullscreen", "-f", "-fm", "-mf", "--benchmark")
+    ),
+    vsync=not any(x in sys.argv for x in ("--no-vsync", "--benchmark")),
 )
 
 
@@ -492,6 +532,88 @@ def is_angle_between(a: float, test_angle: float, b: float) -> bool:
     return abs(a - b) < 180
 
 
+class AtlasImage(Image):
+    # like a texture of its own, but it only covers its part of the atlas
+    @property
+    def width(self) -> int:
+        return self.srcrect.width
+
+    @property
+    def height(self) -> int:
+        return self.srcrect.height
+
+    def get_rect(self, **kwargs) -> pygame.Rect:
+        rect = pygame.Rect(0, 0, self.width, self.height)
+        for key, value in kwargs.items():
+            setattr(rect, key, value)
+        return rect
+
+
+class AtlasPacker:
+    def __init__(
+        self, size: int = 2048, padding: int = 1, keep_pixels: bool = False
+    ) -> None:
+        self.size = size
+        self.padding = padding
+        self.pages: list[Texture] = []
+        # copies of the pages for dumping them, which cost as much memory as the pages
+        self.surfaces: list[pygame.Surface] | None = [] if keep_pixels else None
+        # the images go into rows (shelves) that are as high as their highest image
+        self.x = self.y = self.shelf_height = 0
+
+    def add(self, surf: pygame.Surface) -> AtlasImage:
+        """
+        Packs an image into the current atlas page, starting a new page when it is full.
+        :param surf: the image, whose colorkey or alpha becomes transparency
+        :return: the image as part of its page, which blits like a texture of its own
+        """
+        w, h = surf.get_size()
+        rgba = pygame.Surface((w, h), pygame.SRCALPHA)
+        rgba.blit(surf, (0, 0))
+        if w > self.size or h > self.size:
+            # too big to share a page
+            return AtlasImage(Texture.from_surface(display.renderer, rgba))
+        if self.x + w > self.size:
+            self.x = 0
+            self.y += self.shelf_height
+            self.shelf_height = 0
+        if not self.pages or self.y + h > self.size:
+            self.new_page()
+        rect = pygame.Rect(self.x, self.y, w, h)
+        # pygame-ce 2.4 puts the area at the origin when it is given as a Rect
+        self.pages[-1].update(rgba, tuple(rect))
+        if self.surfaces is not None:
+            self.surfaces[-1].blit(rgba, rect)
+        # the padding keeps the neighbours out when an image is scaled with filtering
+        self.x += w + self.padding
+        self.shelf_height = max(self.shelf_height, h + self.padding)
+        return AtlasImage(self.pages[-1], rect)
+
+    def new_page(self) -> None:
+        """
+        Starts a new, fully transparent atlas page.
+        """
+        blank = pygame.Surface((self.size, self.size), pygame.SRCALPHA)
+        page = Texture(display.renderer, (self.size, self.size), static=True)
+        page.update(blank)
+        page.blend_mode = pygame.BLENDMODE_BLEND
+        self.pages.append(page)
+        if self.surfaces is not None:
+            self.surfaces.append(blank)
+        self.x = self.y = self.shelf_height = 0
+
+    def dump(self, directory: Path) -> None:
+        """
+        Saves the atlas pages as images, for debugging the packing.
+        :param directory: the directory to save the pages to
+        """
+        if self.surfaces is None:
+            return
+        os.makedirs(directory, exist_ok=True)
+        for index, surf in enumerate(self.surfaces):
+            pygame.image.save(surf, Path(directory, f"atlas_{index}.png"))
+
+
 def imgload(
     *path_,
     colorkey: tuple[int, int, int] = None,
@@ -502,6 +624,7 @@ def imgload(
     scale: int = 1,
     to_tex: bool = True,
     return_rect: bool = False,
+    packed: bool = False,
 ) -> tuple[Texture, pygame.Rect]:
     """
     Loads an image given the path and extra (keyword) arguments
@@ -514,6 +637,7 @@ def imgload(
     :param scale: the scale factor for the image(s)
     :param to_tex: whether to convert the Surface object to a Texture object (the default is True)
     :param return_rect: whether to also return a rect together with the image(s)
+    :param packed: whether to pack the texture(s) into the shared atlas (see AtlasPacker)
     :return: the loaded image, and optionally the rect
     """
     # init
@@ -530,19 +654,22 @@ def imgload(
                 i * frames_used[1], 0, frames_used[1] - whitespace, img.get_height()
             )
         )
-    for i in range(frame_pause):
-        ret.append(ret[0])
+    # the repeated frames share the image of the frame they repeat
+    order = list(range(len(ret))) + [0] * frame_pause
     if end_frame is not None:
-        ret.append(ret[end_frame])
+        order.append(end_frame)
     # colorkey
     if colorkey is not None:
         for x in ret:
             x.set_colorkey(colorkey)
-    if to_tex:
+    if to_tex and packed:
+        ret = [texture_atlas.add(pygame.transform.scale_by(x, scale)) for x in ret]
+    elif to_tex:
         ret = [
             Texture.from_surface(display.renderer, pygame.transform.scale_by(x, scale))
             for x in ret
         ]
+    ret = [ret[i] for i in order]
     # final return
     if frames is None:
         ret = ret[0]
@@ -604,6 +731,128 @@ def load_map_from_csv(path_: str, int_: bool = True) -> list[list[int]]:
         return [[int(x) if int_ else x.lstrip() for x in line] for line in reader]
 
 
+class GlyphAtlas:
+    # the printable ASCII characters
+    chars = "".join(map(chr, range(32, 127)))
+
+    def __init__(self, font: pygame.Font, columns: int = 16) -> None:
+        self.height = font.get_height()
+        cell = max(font.size(char)[0] for char in self.chars)
+        surf = pygame.Surface(
+            (columns * cell, ceil(len(self.chars) / columns) * self.height),
+            pygame.SRCALPHA,
+        )
+        # white glyphs, which get their color from the texture color when drawn
+        self.rects = {}
+        for index, char in enumerate(self.chars):
+            rect = pygame.Rect(
+                index % columns * cell,
+                index // columns * self.height,
+                font.size(char)[0],
+                self.height,
+            )
+            surf.blit(font.render(char, True, Colors.WHITE), rect)
+            self.rects[char] = rect
+        self.tex = Texture.from_surface(display.renderer, surf)
+
+
+class GlyphText:
+    def __init__(self, atlas: GlyphAtlas, text: str, color: Color) -> None:
+        self.atlas = atlas
+        self.text = text
+        self.text_color = color
+        self.width = sum(atlas.rects[char].width for char in text)
+        self.height = atlas.height
+        # tint and transparency on top of the text color, like on a texture
+        self.color = Colors.WHITE
+        self.alpha = 255
+
+    def get_rect(self, **kwargs) -> pygame.Rect:
+        rect = pygame.Rect(0, 0, self.width, self.height)
+        for key, value in kwargs.items():
+            setattr(rect, key, value)
+        return rect
+
+    def draw(
+        self, srcrect: Optional[pygame.Rect] = None, dstrect: Optional[pygame.Rect] = None
+    ) -> None:
+        """
+        Draws the text glyph by glyph from the atlas, stretched to the destination.
+        :param srcrect: unused, the whole text is drawn
+        :param dstrect: the destination rect or position (the default is the top left)
+        """
+        if dstrect is None:
+            dstrect = (0, 0)
+        if len(dstrect) == 2:
+            dstrect = (*dstrect, self.width, self.height)
+        x, y, w, h = dstrect
+        scale = w / self.width if self.width else 1
+        tex = self.atlas.tex
+        tex.color = [c * t // 255 for c, t in zip(self.text_color[:3], self.color[:3])]
+        tex.alpha = self.alpha
+        for char in self.text:
+            rect = self.atlas.rects[char]
+            if char != " ":
+                tex.draw(srcrect=rect, dstrect=(x, y, rect.width * scale, h))
+            x += rect.width * scale
+
+
+class TextCache:
+    def __init__(self, size: int = 256) -> None:
+        self.size = size
+        # textures of the strings that are drawn in more than one frame
+        self.textures: OrderedDict[tuple, Texture] = OrderedDict()
+        # the frame in which every string was last drawn from the glyphs
+        self.seen: dict[tuple, int] = {}
+        self.atlases: dict[pygame.Font, GlyphAtlas] = {}
+        self.frame = 0
+
+    def get(self, text: str, font: pygame.Font, color: Color) -> Texture | GlyphText:
+        """
+        Gives something to draw a string with: a cached texture if the string was already
+        drawn in an earlier frame, otherwise glyphs from the atlas of the font. A string
+        only gets a texture once it is drawn again in a later frame (or right away if the
+        atlas lacks some of its characters), so strings that change every frame don't
+        upload one each frame.
+        :param text: the string
+        :param font: the font
+        :param color: the text color
+        :return: a texture or the glyphs, which both blit like a texture
+        """
+        key = (text, font, tuple(color))
+        if key in self.textures:
+            self.textures.move_to_end(key)
+            return self.textures[key]
+        printable = all(char in GlyphAtlas.chars for char in text)
+        if not printable or self.seen.get(key, self.frame) < self.frame:
+            tex = Texture.from_surface(display.renderer, font.render(text, True, color))
+            self.textures[key] = tex
+            self.seen.pop(key, None)
+            # forget the strings that went unused for the longest
+            while len(self.textures) > self.size:
+                self.textures.popitem(last=False)
+            return tex
+        if len(self.seen) > 4 * self.size:
+            self.seen.clear()
+        self.seen[key] = self.frame
+        if font not in self.atlases:
+            self.atlases[font] = GlyphAtlas(font)
+        return GlyphText(self.atlases[font], text, color)
+
+    def forget(self, font: pygame.Font) -> None:
+        """
+        Drops the glyph atlas and the textures of a font that was closed.
+        :param font: the font
+        """
+        self.atlases.pop(font, None)
+        for cache in (self.textures, self.seen):
+            for key in [key for key in cache if key[1] is font]:
+                del cache[key]
+
+    def end_frame(self) -> None:
+        self.frame += 1
+
+
 def text2tex(content: str | int, font_size: int) -> Texture:
     """
     Convert text to a texture
@@ -650,11 +899,13 @@ def write(
         write(anchor, content, font, bc, x + bw, y - bw)
         write(anchor, content, font, bc, x - bw, y + bw)
         write(anchor, content, font, bc, x + bw, y + bw)
-    tex = font.render(str(content), True, color)
     if convert_to_tex:
-        tex = Texture.from_surface(display.renderer, tex)
+        # the texture may be shared with earlier calls, which may have tinted it
+        tex = text_cache.get(str(content), font, color)
+        tex.color = Colors.WHITE
         tex.alpha = alpha
     else:
+        tex = font.render(str(content), True, color)
         tex.set_alpha(alpha)
     rect = tex.get_rect()
 
@@ -689,6 +940,31 @@ def borderize(
     return surf
 
 
+def shade_atlas(img: pygame.Surface, buckets: int, levels: int) -> list[Texture]:
+    """
+    Builds the mip levels of an image, each with darker copies for the distance shading
+    :param img: the image
+    :param buckets: the number of shade buckets, stacked from black at the top to the full brightness at the bottom
+    :param levels: the number of mip levels, each half as big as the previous one
+    :return: a texture per mip level
+    """
+    ret = []
+    # smoothscale needs 32 bit pixels
+    base = pygame.Surface(img.get_size(), pygame.SRCALPHA)
+    base.blit(img, (0, 0))
+    for level in range(levels):
+        size = [max(s >> level, 1) for s in base.get_size()]
+        mip = pygame.transform.smoothscale(base, size)
+        atlas = pygame.Surface((size[0], size[1] * buckets), pygame.SRCALPHA)
+        for bucket in range(buckets):
+            shade = 255 * bucket // (buckets - 1)
+            rect = pygame.Rect(0, size[1] * bucket, *size)
+            atlas.blit(mip, rect)
+            atlas.fill((shade, shade, shade), rect, special_flags=pygame.BLEND_RGB_MULT)
+        ret.append(Texture.from_surface(display.renderer, atlas))
+    return ret
+
+
 def pi2pi(angle: float) -> float:
     """
     Normalize the angle in radians to 2 * pi (in radialen)
@@ -709,6 +985,9 @@ def angle_diff(angle1: float, angle2: float) -> float:
 
 
 cursor = Cursor()
+text_cache = TextCache()
+# the small images that are blitted all over the place share a few textures
+texture_atlas = AtlasPacker(keep_pixels="--dump-atlases" in sys.argv)
 
 client_udp: Client = None
 client_tcp: Client = None
@@ -0,0 +1,806 @@
+import numpy as np
+
+from math import ceil, cos, inf, sin
+from typing import Callable
+
+# the part of the draw distance over which things fade out (see fog)
+FOG_BAND = 0.25
+
+
+class ColumnHits:
+    fields = (
+        ("hit", np.bool_),
+        ("dist", np.float64),
+        ("tile", np.int32),
+        ("tile_x", np.int32),
+        ("tile_y", np.int32),
+        ("orien", np.int8),
+        ("u", np.float64),
+        ("dx", np.float64),
+        ("dy", np.float64),
+    )
+
+    def __init__(self, size: int, buffer: memoryview | None = None) -> None:
+        # the arrays can live in a shared buffer (see castpool), one after the other
+        offset = 0
+        for name, dtype in self.fields:
+            if buffer is None:
+                array = np.zeros(size, dtype=dtype)
+            else:
+                array = np.ndarray(size, dtype=dtype, buffer=buffer, offset=offset)
+                offset += self.field_nbytes(size, dtype)
+            setattr(self, name, array)
+        self.clear()
+
+    @staticmethod
+    def field_nbytes(size: int, dtype: type) -> int:
+        # keep every array 8 byte aligned
+        return -(-size * np.dtype(dtype).itemsize // 8) * 8
+
+    @classmethod
+    def nbytes(cls, size: int) -> int:
+        return sum(cls.field_nbytes(size, dtype) for _, dtype in cls.fields)
+
+    def clear(self) -> None:
+        self.hit[:] = False
+        self.dist[:] = np.inf
+
+    def view(self, columns: slice) -> "ColumnHits":
+        """
+        Gives the hits of a range of columns, sharing the arrays with these hits.
+        :param columns: the range of columns
+        :return: the hits of the columns
+        """
+        hits = ColumnHits.__new__(ColumnHits)
+        for name, _ in self.fields:
+            setattr(hits, name, getattr(self, name)[columns])
+        return hits
+
+    def copy(self) -> "ColumnHits":
+        hits = ColumnHits.__new__(ColumnHits)
+        for name, _ in self.fields:
+            setattr(hits, name, getattr(self, name).copy())
+        return hits
+
+
+class ProjectionTable:
+    def __init__(
+        self,
+        fov: int,
+        ray_density: int,
+        width: int,
+        height: int,
+        projection_dist: float,
+    ) -> None:
+        self.key = (fov, ray_density, width)
+        self.args = (fov, ray_density, width, height, projection_dist)
+        self.offsets = np.radians(
+            -fov // 2 + np.arange(ray_density + 1) * fov / ray_density
+        )
+        # direction deltas, rotated by the player angle each frame
+        self.cos = np.cos(self.offsets)
+        self.sin = np.sin(self.offsets)
+        # the distance along the view direction is the ray distance times cos(offset)
+        self.fisheye = self.cos
+        self.center = int(np.abs(self.offsets).argmin())
+        self.column_width = width / ray_density
+        self.column_x = np.arange(ray_density + 1) * self.column_width
+        # wall height in pixels is height_scale / distance in pixels
+        self.height_scale = projection_dist * height / 2 * 60 / fov
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+
+class RayCache:
+    def __init__(
+        self,
+        position_step: float = 1e-4,
+        angle_step: float = 1e-5,
+        caster: Callable[..., ColumnHits] | None = None,
+    ) -> None:
+        self.position_step = position_step
+        self.angle_step = angle_step
+        # cast_columns, or anything with its signature that also takes the version of
+        # the walls (e.g. CastPool.cast)
+        self.caster = caster
+        self.key = None
+        self.hits = None
+
+    def cast(
+        self,
+        walls: np.ndarray,
+        start_x: float,
+        start_y: float,
+        angle: float,
+        table: ProjectionTable,
+        skip: np.ndarray | None = None,
+        max_dist: float = 300,
+        version: int | None = None,
+    ) -> ColumnHits:
+        """
+        Casts the columns like cast_columns, but reuses the last hits for the same pose.
+        :param walls: the wall grid (see load_grid)
+        :param start_x: the starting x position of the rays in tiles
+        :param start_y: the starting y position of the rays in tiles
+        :param angle: the player direction in radians
+        :param table: the projection table holding the direction of every column
+        :param skip: the empty space around every wall tile (see load_skip_field)
+        :param max_dist: the distance in tiles after which rays give up
+        :param version: the version of the walls, which changes whenever they do (see
+        ChunkedMap.version); without one the hits are never reused
+        :return: the per-column hits, the same object as last time if nothing changed
+        """
+        key = (
+            version,
+            table.key,
+            max_dist,
+            round(start_x / self.position_step),
+            round(start_y / self.position_step),
+            round(angle / self.angle_step),
+        )
+        if version is None or key != self.key:
+            if self.caster is None:
+                self.hits = cast_columns(
+                    walls, start_x, start_y, angle, table, skip=skip, max_dist=max_dist
+                )
+            else:
+                self.hits = self.caster(
+                    walls,
+                    start_x,
+                    start_y,
+                    angle,
+                    table,
+                    skip=skip,
+                    max_dist=max_dist,
+                    version=version,
+                )
+            self.key = key
+        return self.hits
+
+
+class SpanBuffer:
+    fields = (
+        ("stage", np.int8),
+        ("tex_id", np.int32),
+        ("x1", np.float64),
+        ("x2", np.float64),
+        ("y1", np.float64),
+        ("y2", np.float64),
+        ("b1", np.float64),
+        ("b2", np.float64),
+        ("u1", np.float64),
+        ("u2", np.float64),
+        ("s1", np.int32),
+        ("s2", np.int32),
+        ("bucket", np.int32),
+        ("lod", np.int8),
+    )
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.size = 0
+        for name, dtype in self.fields:
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+
+    def clear(self) -> None:
+        self.size = 0
+
+    def append(self, **values: np.ndarray | int) -> None:
+        """
+        Adds spans to the end of the buffer, growing it if it's full.
+        :param values: the value or the array of values of every field
+        """
+        count = len(values["x1"])
+        end = self.size + count
+        if end > self.capacity:
+            self.capacity = max(end, self.capacity * 2)
+            for name, _ in self.fields:
+                array = getattr(self, name)
+                grown = np.zeros(self.capacity, dtype=array.dtype)
+                grown[: self.size] = array[: self.size]
+                setattr(self, name, grown)
+        for name, _ in self.fields:
+            getattr(self, name)[self.size : end] = values[name]
+        self.size = end
+
+    def order(self) -> np.ndarray:
+        """
+        Gives the draw order of the spans: by stage, then by texture and mip level.
+        :return: the indices of the spans in draw order
+        """
+        size = self.size
+        return np.lexsort((self.lod[:size], self.tex_id[:size], self.stage[:size]))
+
+
+class DepthBuffer:
+    def __init__(self, table: ProjectionTable, depth: np.ndarray) -> None:
+        self.column_x = table.column_x
+        self.column_width = table.column_width
+        # the distance to the wall along every column, inf where nothing was hit
+        self.depth = depth
+
+    def column(self, x: float) -> int:
+        """
+        Gives the column at a screen x coordinate.
+        :param x: the screen x coordinate
+        :return: the index of the column
+        """
+        return min(max(int(x // self.column_width), 0), len(self.depth) - 1)
+
+    def occluded(self, column: int, depth: float) -> bool:
+        """
+        Checks whether something in a column is behind the wall.
+        :param column: the index of the column
+        :param depth: the distance to the thing
+        :return: whether the wall hides it
+        """
+        return self.depth[column] < depth
+
+    def visible_runs(
+        self, left: float, right: float, depth: float
+    ) -> list[tuple[float, float]]:
+        """
+        Gives the parts of a horizontal screen range that aren't hidden by walls.
+        :param left: the left of the range
+        :param right: the right of the range
+        :param depth: the distance to the thing covering the range
+        :return: the left and right screen x coordinates of every visible part
+        """
+        first = max(int(left // self.column_width), 0)
+        last = min(int(-(-right // self.column_width)), len(self.depth))
+        if first >= last or left >= right:
+            return []
+        visible = self.depth[first:last] >= depth
+        if visible.all():
+            return [(left, right)]
+        edges = np.flatnonzero(np.diff(visible, prepend=False, append=False)) + first
+        starts, ends = edges[::2], edges[1::2]
+        return list(
+            zip(
+                np.maximum(self.column_x[starts], left).tolist(),
+                np.minimum(self.column_x[ends - 1] + self.column_width, right).tolist(),
+            )
+        )
+
+
+def load_grid(map_: list[list[int]]) -> np.ndarray:
+    """
+    Converts a map loaded by load_map_from_csv to the grid used by the casting engine
+    :param map_: the map as a 2D list
+    :return: the map as a 2D array of tile ids, in the smallest integer type for them
+    """
+    grid = np.asarray(map_)
+    # a byte per tile for the usual tile ids, which keeps big maps small
+    return grid.astype(
+        np.promote_types(np.min_scalar_type(grid.min()), np.min_scalar_type(grid.max()))
+    )
+
+
+def load_skip_field(walls: np.ndarray, max_radius: int = 16) -> np.ndarray:
+    """
+    Gives every tile the radius of the square around it that is empty and inside of the
+    map, so that rays can skip over empty space (see cast_columns)
+    :param walls: the wall grid (see load_grid)
+    :param max_radius: the largest radius worth looking for
+    :return: the radius of the empty square around every tile, 0 next to and on walls
+    """
+    free = walls == 0
+    # the radius never goes past max_radius, so a byte per tile is enough
+    radius = np.zeros(walls.shape, dtype=np.uint8)
+    for _ in range(max_radius):
+        # a square grows by one tile if the squares of all of its neighbours are empty
+        # as well, where the tiles outside of the map aren't
+        padded = np.pad(free, 1)
+        rows = padded[:, :-2] & padded[:, 1:-1] & padded[:, 2:]
+        free = rows[:-2] & rows[1:-1] & rows[2:]
+        if not free.any():
+            break
+        radius += free
+    return radius
+
+
+def skip_empty(
+    skip: np.ndarray,
+    cur_x: np.ndarray,
+    cur_y: np.ndarray,
+    step_x: np.ndarray,
+    step_y: np.ndarray,
+    x_steps: np.ndarray,
+    y_steps: np.ndarray,
+    x_start: np.ndarray,
+    y_start: np.ndarray,
+    hypot_x: np.ndarray,
+    hypot_y: np.ndarray,
+    max_dist: float,
+) -> None:
+    """
+    Advances the DDA state of the rays in place past all of the steps inside of the
+    empty square around their tile, exactly as if they had been taken one by one.
+    :param skip: the empty space around every tile (see load_skip_field)
+    :param cur_x: the tile x of every ray
+    :param cur_y: the tile y of every ray
+    :param step_x: the x direction of every ray (-1 or 1)
+    :param step_y: the y direction of every ray (-1 or 1)
+    :param x_steps: the steps taken along x by every ray
+    :param y_steps: the steps taken along y by every ray
+    :param x_start: the distance to the first vertical tile edge of every ray
+    :param y_start: the distance to the first horizontal tile edge of every ray
+    :param hypot_x: the distance between vertical tile edges of every ray
+    :param hypot_y: the distance between horizontal tile edges of every ray
+    :param max_dist: the distance in tiles after which rays give up
+    """
+    # the rays that are still travelling are inside of the map
+    radius = skip[cur_y, cur_x]
+    # a single step doesn't pay for itself
+    far = np.flatnonzero(radius > 1)
+    if not far.size:
+        return
+    radius = radius[far]
+    xs, ys = x_steps[far], y_steps[far]
+    x0, y0 = x_start[far], y_start[far]
+    hx, hy = hypot_x[far], hypot_y[far]
+    # after radius steps along an axis the next one leaves the square, and the steps
+    # from max_dist on are the last ones
+    bound = np.minimum(
+        np.minimum(x0 + (xs + radius) * hx, y0 + (ys + radius) * hy), max_dist
+    )
+    # the DDA takes the steps in the order of their lengths (y first on ties), so the
+    # ones below the bound are exactly the next ones it takes
+    with np.errstate(divide="ignore", invalid="ignore"):
+        count_x = np.fmin(np.fmax(np.ceil((bound - (x0 + xs * hx)) / hx), 0), radius)
+        count_y = np.fmin(np.fmax(np.ceil((bound - (y0 + ys * hy)) / hy), 0), radius)
+    # the division can be a step off either way, which the lengths themselves settle,
+    # computed like cast_columns does (axis-parallel rays have infinite lengths)
+    while True:
+        less_x = (count_x > 0) & (x0 + (xs + count_x - 1) * hx >= bound)
+        more_x = (count_x < radius) & (x0 + (xs + count_x) * hx < bound)
+        less_y = (count_y > 0) & (y0 + (ys + count_y - 1) * hy >= bound)
+        more_y = (count_y < radius) & (y0 + (ys + count_y) * hy < bound)
+        if not (less_x | more_x | less_y | more_y).any():
+            break
+        count_x += more_x
+        count_x -= less_x
+        count_y += more_y
+        count_y -= less_y
+    x_steps[far] = xs + count_x
+    y_steps[far] = ys + count_y
+    cur_x[far] += count_x.astype(np.int64) * step_x[far]
+    cur_y[far] += count_y.astype(np.int64) * step_y[far]
+
+
+def cast_ray(
+    walls: np.ndarray,
+    start_x: float,
+    start_y: float,
+    dx: float,
+    dy: float,
+    max_dist: float = 300,
+) -> tuple[float, int, int, int, int, float] | None:
+    """
+    Casts a single ray one tile at a time, the reference for cast_columns, which follows
+    the same DDA with the same arithmetic
+    :param walls: the wall grid (see load_grid)
+    :param start_x: the starting x position of the ray in tiles
+    :param start_y: the starting y position of the ray in tiles
+    :param dx: the x part of the unit direction of the ray
+    :param dy: the y part of the unit direction of the ray
+    :param max_dist: the distance in tiles after which the ray gives up
+    :return: the distance, tile id, tile x, tile y, orientation and texture u of the
+    hit, or None if nothing was hit
+    """
+    map_height, map_width = walls.shape
+    cur_x, cur_y = int(start_x), int(start_y)
+    # rays parallel to an axis never reach the tile edges across it
+    hypot_x = abs(1 / dx) if dx else 0
+    hypot_y = abs(1 / dy) if dy else 0
+    step_x = -1 if dx < 0 else 1
+    step_y = -1 if dy < 0 else 1
+    x_start = y_start = inf
+    if dx:
+        x_start = (start_x - cur_x if dx < 0 else cur_x + 1 - start_x) * hypot_x
+    if dy:
+        y_start = (start_y - cur_y if dy < 0 else cur_y + 1 - start_y) * hypot_y
+    x_steps = y_steps = 0
+
+    while True:
+        # the n-th tile edge is always computed the same way, however it was reached
+        x_length = x_start + x_steps * hypot_x
+        y_length = y_start + y_steps * hypot_y
+        x_side = x_length < y_length
+        if x_side:
+            cur_x += step_x
+            x_steps += 1
+            dist = x_length
+        else:
+            cur_y += step_y
+            y_steps += 1
+            dist = y_length
+        if not (0 <= cur_x < map_width and 0 <= cur_y < map_height):
+            return None
+        tile = int(walls[cur_y, cur_x])
+        if tile:
+            break
+        if dist >= max_dist:
+            return None
+
+    if x_side:
+        orien = 3 if step_x == 1 else 1
+        u = start_y + dist * dy - cur_y
+    else:
+        orien = 0 if step_y == 1 else 2
+        along_x = start_x + dist * dx - cur_x
+        u = 1 - along_x if orien == 0 else along_x
+    return dist, tile, cur_x, cur_y, orien, min(max(u, 0), np.nextafter(1, 0))
+
+
+def cast_columns(
+    walls: np.ndarray,
+    start_x: float,
+    start_y: float,
+    angle: float,
+    table: ProjectionTable,
+    max_dist: float = 300,
+    columns: slice = slice(None),
+    hits: ColumnHits | None = None,
+    skip: np.ndarray | None = None,
+) -> ColumnHits:
+    """
+    Casts one ray per screen column at once, stepping through the tile grid with a DDA
+    :param walls: the wall grid (see load_grid)
+    :param start_x: the starting x position of the rays in tiles
+    :param start_y: the starting y position of the rays in tiles
+    :param angle: the player direction in radians
+    :param table: the projection table holding the direction of every column
+    :param max_dist: the distance in tiles after which rays give up
+    :param columns: the range of columns to cast
+    :param hits: where to write the hits of the columns to, cleared beforehand
+    :param skip: the empty space around every tile (see load_skip_field), which lets
+    rays jump over the steps that can't hit anything
+    :return: the per-column hits, with the orientations 0 (top), 1 (right), 2 (bottom)
+    and 3 (left)
+    """
+    table_cos, table_sin = table.cos[columns], table.sin[columns]
+    size = len(table_cos)
+    if hits is None:
+        hits = ColumnHits(size)
+    else:
+        hits.clear()
+    cos_a, sin_a = cos(angle), sin(angle)
+    dx = hits.dx
+    dy = hits.dy
+    np.subtract(cos_a * table_cos, sin_a * table_sin, out=dx)
+    np.add(sin_a * table_cos, cos_a * table_sin, out=dy)
+
+    map_height, map_width = walls.shape
+    base_x, base_y = int(start_x), int(start_y)
+    # sqrt(1 + (dy / dx) ** 2) reduces to 1 / |dx| for unit directions, and rays
+    # parallel to an axis never reach the tile edges across it
+    with np.errstate(divide="ignore"):
+        hypot_x = np.abs(1 / dx)
+        hypot_y = np.abs(1 / dy)
+    hypot_x[dx == 0] = 0
+    hypot_y[dy == 0] = 0
+
+    step_x = np.where(dx < 0, -1, 1)
+    step_y = np.where(dy < 0, -1, 1)
+    x_start = np.where(dx < 0, start_x - base_x, base_x + 1 - start_x) * hypot_x
+    y_start = np.where(dy < 0, start_y - base_y, base_y + 1 - start_y) * hypot_y
+    x_start[dx == 0] = np.inf
+    y_start[dy == 0] = np.inf
+    # counted in floats, which hold whole numbers exactly and multiply without casting
+    x_steps = np.zeros(size)
+    y_steps = np.zeros(size)
+
+    # only the rays that are still travelling are kept in these arrays
+    ids = np.arange(size)
+    cur_x = np.full(size, base_x)
+    cur_y = np.full(size, base_y)
+    while ids.size:
+        if skip is not None:
+            skip_empty(
+                skip,
+                cur_x,
+                cur_y,
+                step_x,
+                step_y,
+                x_steps,
+                y_steps,
+                x_start,
+                y_start,
+                hypot_x,
+                hypot_y,
+                max_dist,
+            )
+        # the n-th tile edge is always computed the same way, however it was reached
+        x_length = x_start + x_steps * hypot_x
+        y_length = y_start + y_steps * hypot_y
+        x_side = x_length < y_length
+        cur_x += np.where(x_side, step_x, 0)
+        cur_y += np.where(x_side, 0, step_y)
+        x_steps += x_side
+        y_steps += ~x_side
+        dist = np.where(x_side, x_length, y_length)
+
+        inside = (
+            (cur_x >= 0) & (cur_x < map_width) & (cur_y >= 0) & (cur_y < map_height)
+        )
+        tile = np.zeros(ids.size, dtype=np.int32)
+        tile[inside] = walls[cur_y[inside], cur_x[inside]]
+        col = tile != 0
+        done = col | ~inside | (dist >= max_dist)
+
+        if done.any():
+            col_ids = ids[col]
+            hits.hit[col_ids] = True
+            hits.dist[col_ids] = dist[col]
+            hits.tile[col_ids] = tile[col]
+            hits.tile_x[col_ids] = cur_x[col]
+            hits.tile_y[col_ids] = cur_y[col]
+            hits.orien[col_ids] = np.where(
+                x_side[col],
+                np.where(step_x[col] == 1, 3, 1),
+                np.where(step_y[col] == 1, 0, 2),
+            )
+
+            keep = ~done
+            ids = ids[keep]
+            cur_x, cur_y = cur_x[keep], cur_y[keep]
+            step_x, step_y = step_x[keep], step_y[keep]
+            x_steps, y_steps = x_steps[keep], y_steps[keep]
+            x_start, y_start = x_start[keep], y_start[keep]
+            hypot_x, hypot_y = hypot_x[keep], hypot_y[keep]
+
+    # texture coordinate along the face, depending on the side that was hit
+    with np.errstate(invalid="ignore"):
+        hit_x = start_x + hits.dist * dx
+        hit_y = start_y + hits.dist * dy
+        along_x = hit_x - hits.tile_x
+        along_y = hit_y - hits.tile_y
+    u = np.select([hits.orien == 0, hits.orien == 2], [1 - along_x, along_x], along_y)
+    u[~hits.hit] = 0
+    np.clip(u, 0, np.nextafter(1, 0), out=hits.u)
+    return hits
+
+
+def fog(dist: np.ndarray | float, draw_distance: float) -> np.ndarray:
+    """
+    Fades things out over the last part of the draw distance, to black like the shading.
+    :param dist: the distance to every thing in tiles
+    :param draw_distance: the distance in tiles from which on nothing is visible anymore
+    :return: the brightness factor of every thing, from 0 to 1
+    """
+    return np.clip((draw_distance - dist) / (FOG_BAND * draw_distance), 0, 1)
+
+
+def shade_texels(textures: np.ndarray, levels: int = 64) -> np.ndarray:
+    """
+    Darkens textures to evenly spaced shade levels and packs the texels into RGBA bytes.
+    :param textures: the textures as an array of shape (textures, height, width, 3 or 4)
+    :param levels: the number of shade levels, from black to full brightness
+    :return: the packed texels as an array of shape (levels, textures, height, width)
+    """
+    shades = np.linspace(0, 1, levels).reshape(-1, 1, 1, 1, 1)
+    shaded = (textures[None, ..., :3] * shades).astype(np.uint32)
+    # the alpha isn't shaded, and textures without one are opaque
+    alpha = textures[..., 3].astype(np.uint32) if textures.shape[-1] == 4 else 255
+    # contiguous, so that the texels can be gathered through a flat view
+    return np.ascontiguousarray(
+        shaded[..., 0] | shaded[..., 1] << 8 | shaded[..., 2] << 16 | alpha << 24
+    )
+
+
+def cast_planes(
+    grid: np.ndarray,
+    floor_texels: np.ndarray,
+    ceiling_texels: np.ndarray,
+    start_x: float,
+    start_y: float,
+    angle: float,
+    table: ProjectionTable,
+    tile_size: int,
+    horizon: float,
+    height: int,
+    out: np.ndarray,
+    draw_distance: float = np.inf,
+) -> tuple[int, int]:
+    """
+    Casts the floor and the ceiling a row of pixels (as tall as a column is wide) at a
+    time.
+    :param grid: the floor layer, with the texture index of every tile (0 off the map)
+    :param floor_texels: the shaded floor textures (see shade_texels), sized a power
+    of 2
+    :param ceiling_texels: the shaded ceiling textures, shaped like the floor textures
+    :param start_x: the x position of the camera in tiles
+    :param start_y: the y position of the camera in tiles
+    :param angle: the player direction in radians
+    :param table: the projection table holding the direction of every column
+    :param tile_size: the size of a tile in pixels
+    :param horizon: the screen y coordinate of the horizon
+    :param height: the screen height
+    :param out: the rows of packed pixels to write to, of shape (rows, columns)
+    :param draw_distance: the distance in tiles over which the planes fade out (see fog)
+    :return: the number of ceiling rows (written first, top to bottom) and of the floor
+    rows after them
+    """
+    row_height = table.column_width
+    ceiling_rows = min(ceil(min(max(horizon, 0), height) / row_height), len(out))
+    floor_rows = min(
+        ceil(min(max(height - horizon, 0), height) / row_height),
+        len(out) - ceiling_rows,
+    )
+    rows = max(ceiling_rows, floor_rows)
+    if not rows:
+        return 0, 0
+    # the floor and the ceiling mirror each other around the horizon, so they share
+    # the world positions
+    below = (np.arange(rows) + 0.5) * row_height
+    # a wall ends that far below the horizon at the distance where it is 2 * below tall
+    dist = (table.height_scale / (2 * below) / tile_size).astype(np.float32)
+    columns = slice(0, out.shape[1])
+    cos_a, sin_a = cos(angle), sin(angle)
+    # the distance along the view direction is the ray distance times cos(offset)
+    fisheye = table.fisheye[columns]
+    dx = (cos_a * table.cos[columns] - sin_a * table.sin[columns]) / fisheye
+    dy = (sin_a * table.cos[columns] + cos_a * table.sin[columns]) / fisheye
+    levels, textures, size = floor_texels.shape[:3]
+    shift = size.bit_length() - 1
+
+    # texel coordinates over the whole map (single precision is plenty at map scale),
+    # where everything outside of the map falls on a border of empty tiles
+    map_height, map_width = grid.shape
+    texel_x = (start_x + 1 + dist[:, None] * dx.astype(np.float32)) * size
+    texel_y = (start_y + 1 + dist[:, None] * dy.astype(np.float32)) * size
+    np.clip(texel_x, 0, (map_width + 2) * size - 1, out=texel_x)
+    np.clip(texel_y, 0, (map_height + 2) * size - 1, out=texel_y)
+    texel_x = texel_x.astype(np.int32)
+    texel_y = texel_y.astype(np.int32)
+    tiles = (
+        np.pad(grid, 1)
+        .ravel()
+        .take((texel_y >> shift) * (map_width + 2) + (texel_x >> shift))
+    )
+
+    # the same shading as a wall that ends on that row, as an offset into the levels
+    shade = np.minimum(4 * below / height, 1)[:, None] * (levels - 1)
+    # only the far rows reach into the fog, where it depends on the ray distance of
+    # each column
+    fogged = np.count_nonzero(dist / fisheye.min() > draw_distance * (1 - FOG_BAND))
+    if fogged:
+        shade = np.repeat(shade, out.shape[1], axis=1)
+        shade[:fogged] *= fog(dist[:fogged, None] / fisheye, draw_distance)
+    shade = (shade + 0.5).astype(np.int32)
+    texels = (
+        (shade * textures + tiles) << 2 * shift
+        | (texel_y & size - 1) << shift
+        | texel_x & size - 1
+    )
+    out[:ceiling_rows] = ceiling_texels.ravel().take(texels[:ceiling_rows][::-1])
+    out[ceiling_rows : ceiling_rows + floor_rows] = floor_texels.ravel().take(
+        texels[:floor_rows]
+    )
+    return ceiling_rows, floor_rows
+
+
+def find_spans(
+    cols: np.ndarray,
+    keys: tuple[np.ndarray, ...],
+    linear: tuple[tuple[np.ndarray, float], ...] = (),
+    spread: tuple[tuple[np.ndarray, float], ...] = (),
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Groups runs of neighbouring columns into spans that can be drawn as a single quad
+    :param cols: the (ascending) screen columns
+    :param keys: per-column values that must be equal across a span, e.g. the tile and
+    the orientation
+    :param linear: per-column values with the maximum error allowed when interpolating
+    them linearly across a span
+    :param spread: per-column values with the maximum difference allowed within a span
+    :return: the first and last index into cols of every span, in screen order
+    """
+    if not cols.size:
+        return cols[:0], cols[:0]
+    breaks = np.diff(cols) != 1
+    for key in keys:
+        breaks |= np.diff(key) != 0
+    starts = np.flatnonzero(np.concatenate(([True], breaks)))
+    ends = np.concatenate((starts[1:] - 1, [cols.size - 1]))
+
+    # the projection isn't linear in the column angle, so halve spans until the
+    # interpolation fits them
+    done_starts, done_ends = [], []
+    while starts.size:
+        lengths = ends - starts + 1
+        firsts = np.cumsum(lengths) - lengths
+        span = np.repeat(np.arange(starts.size), lengths)
+        elem = starts[span] + np.arange(lengths.sum()) - firsts[span]
+        a, b = starts[span], ends[span]
+        t = (elem - a) / np.maximum(b - a, 1)
+        ok = np.ones(starts.size, dtype=bool)
+        for values, tolerance in linear:
+            error = np.abs(values[elem] - (values[a] + t * (values[b] - values[a])))
+            ok &= np.maximum.reduceat(error, firsts) <= tolerance
+        for values, tolerance in spread:
+            values = values[elem]
+            ok &= (
+                np.maximum.reduceat(values, firsts)
+                - np.minimum.reduceat(values, firsts)
+                <= tolerance
+            )
+        done_starts.append(starts[ok])
+        done_ends.append(ends[ok])
+        mids = (starts + ends) // 2
+        starts = np.concatenate((starts[~ok], mids[~ok] + 1))
+        ends = np.concatenate((mids[~ok], ends[~ok]))
+
+    starts = np.concatenate(done_starts)
+    order = starts.argsort()
+    return starts[order], np.concatenate(done_ends)[order]
+
+
+def skip_mismatches(
+    walls: np.ndarray, table: ProjectionTable, poses: list[tuple[float, float, float]]
+) -> dict[str, int]:
+    """
+    Counts where skipping empty space (see skip_empty) or casting single rays (see
+    cast_ray) gives other hits than the plain DDA of cast_columns.
+    :param walls: the wall grid (see load_grid)
+    :param table: the projection table holding the direction of every column
+    :param poses: the x, y and angle of every view to cast
+    :return: the number of differing columns per field of the hits
+    """
+    skip = load_skip_field(walls)
+    fields = ("hit", "dist", "tile", "tile_x", "tile_y", "orien", "u")
+    counts = dict.fromkeys(fields + ("cast_ray",), 0)
+    for x, y, angle in poses:
+        plain = cast_columns(walls, x, y, angle, table)
+        skipped = cast_columns(walls, x, y, angle, table, skip=skip)
+        for field in fields:
+            counts[field] += int(
+                (getattr(plain, field) != getattr(skipped, field)).sum()
+            )
+        # a few columns are enough for the scalar version
+        for col in range(0, len(table), 97):
+            hit = cast_ray(walls, x, y, plain.dx[col], plain.dy[col])
+            expected = None
+            if plain.hit[col]:
+                expected = (
+                    plain.dist[col],
+                    plain.tile[col],
+                    plain.tile_x[col],
+                    plain.tile_y[col],
+                    plain.orien[col],
+                    plain.u[col],
+                )
+            counts["cast_ray"] += hit != expected
+    return counts
+
+
+if __name__ == "__main__":
+    # python -m client.raycast: checks the casters against the plain DDA from tile
+    # centres, facing along the axes and the diagonals where ties are common
+    import sys
+
+    from pathlib import Path
+
+    maps = {"open arena": np.zeros((256, 256), dtype=np.uint8)}
+    maps["open arena"][[0, -1], :] = maps["open arena"][:, [0, -1]] = 1
+    maps["open arena"][16::16, 16::16] = 1
+    for path in sorted(Path("client", "assets", "maps").glob("*-walls.csv")):
+        maps[path.stem] = np.loadtxt(path, delimiter=",", dtype=np.uint8)
+    table = ProjectionTable(60, 1280, 1280, 720, 32 / np.tan(np.radians(30)))
+    rng = np.random.default_rng(0)
+    failed = False
+    with np.errstate(all="raise"):
+        for name, walls in maps.items():
+            opens = np.argwhere(walls == 0)
+            picks = opens[rng.choice(len(opens), min(len(opens), 40), replace=False)]
+            poses = [
+                (x + 0.5, y + 0.5, angle)
+                for y, x in picks
+                for angle in np.arange(8) * np.pi / 4
+            ]
+            counts = skip_mismatches(walls, table, poses)
+            failed |= any(counts.values())
+            print(f"{name}: {len(poses)} views, mismatches {counts}")
+    sys.exit(failed)
@@ -9,12 +9,26 @@ if __name__ == "__main__":
 Usage:  ./pandemonium
         ./pandemonium (--server | -s)
         ./pandemonium (--help | -h)
-        ./pandemonium [--no-fullscreen | --no-vsync | --no-multiplayer]
+        ./pandemonium [--no-fullscreen | --no-vsync | --no-multiplayer | --parallel-cast]
+        ./pandemonium --software-render   --   Composite the 3D view in NumPy (for software SDL)
+        ./pandemonium --benchmark [--output <file>]   --   Headless renderer benchmark as JSON
+        ./pandemonium --dump-atlases   --   Save the packed texture atlases to atlases/
         ./pandemonium -fm   --   Example: run without fullscreen or multiplayer
 """
         )
     elif "--server" in argv or "-s" in argv:
         import server.server
+    elif "--benchmark" in argv:
+        import os
+
+        # no window and no sound, unless a driver is picked explicitly
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+        # stdout only holds the results, without the pygame banner
+        os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+        from client.benchmark import main
+
+        main()
     else:
         from client.client import *
 